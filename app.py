@@ -1,23 +1,267 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import requests
 
 import re
+import shutil
+import sqlite3
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import queue
+import tempfile
+import time
+import uuid
+import zipfile
 import aiohttp
 import asyncio
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import lru_cache
 
 import os
+import atexit
 import concurrent.futures
+import contextlib
+import cProfile
+import pstats
 import io
+import sys
+import importlib
+import multiprocessing
+import threading
+import psutil
+import Levenshtein
 import psycopg2
+import psycopg2.pool
 import os
 from dotenv import load_dotenv
 
-st.cache_resource.clear()
 # Load environment variables
 load_dotenv()
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Leveled logging. LOG_LEVEL=DEBUG logs per-address transformations, one in every LOG_SAMPLE_EVERY.
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("supprassor")
+logger.setLevel(os.getenv("LOG_LEVEL", "WARNING").upper())
+log_sample_every = max(1, int(os.getenv("LOG_SAMPLE_EVERY", "1000")))
+log_sample_counter = itertools.count()
+# Outside a Streamlit server (the CLI, benchmark, tests and normalization worker processes) the
+# st.cache_data functions cache in memory; silence the warning about the missing runtime
+if not st.runtime.exists():
+    logging.getLogger('streamlit.runtime.caching.cache_data_api').setLevel(logging.ERROR)
+
+
+# Function to log one in every log_sample_every per-row debug messages; nothing is formatted when DEBUG is off
+def log_sampled(message, *args):
+    if logger.isEnabledFor(logging.DEBUG) and next(log_sample_counter) % log_sample_every == 0:
+        logger.debug(message, *args)
+
+
+# Per-stage timings of the current Streamlit run. Each script run has its own thread.
+stage_metrics = threading.local()
+
+
+# Function to start recording stage metrics for this run
+def start_stage_metrics():
+    stage_metrics.stages = {}
+    return stage_metrics.stages
+
+
+# Peak resident memory over the whole life of this process, in MB (for one-off processes such
+# as the benchmark cases; stages report their own peak, see track_stage)
+def peak_memory_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+    return psutil.Process().memory_info().rss / (1 << 20)
+
+
+# Per-stage peak memory: while any stage is open, a background thread samples the process's
+# current RSS every memory_sample_seconds and raises the peak of every open stage. The thread
+# starts when the first stage opens and stops when the last one closes. RSS is per process, so
+# stages of concurrent scrubs see each other's memory.
+memory_sample_seconds = float(os.getenv("MEMORY_SAMPLE_SECONDS", "0.05"))
+open_stage_records = {}
+open_stage_lock = threading.Lock()
+memory_sampler = {'stop': None, 'process': psutil.Process()}
+
+
+def current_memory_mb():
+    return memory_sampler['process'].memory_info().rss / (1 << 20)
+
+
+# Function to raise the peak memory of the open stages to the current RSS
+def sample_stage_memory():
+    memory_mb = current_memory_mb()
+    with open_stage_lock:
+        for record in open_stage_records.values():
+            record['peak_memory_mb'] = max(record['peak_memory_mb'], memory_mb)
+
+
+def run_memory_sampler(stop):
+    while not stop.wait(memory_sample_seconds):
+        sample_stage_memory()
+
+
+# Context manager timing a pipeline stage and its peak memory. Repeated stages (e.g. per chunk)
+# are summed, keeping the highest peak. Set record['rows'] inside the block when the row count
+# is only known afterwards.
+@contextmanager
+def track_stage(stage, rows=0):
+    record = {'rows': rows, 'peak_memory_mb': current_memory_mb()}
+    with open_stage_lock:
+        open_stage_records[id(record)] = record
+        if len(open_stage_records) == 1:
+            memory_sampler['stop'] = threading.Event()
+            threading.Thread(target=run_memory_sampler, args=(memory_sampler['stop'],), name='memory-sampler',
+                             daemon=True).start()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        sample_stage_memory()
+        with open_stage_lock:
+            del open_stage_records[id(record)]
+            if not open_stage_records:
+                memory_sampler['stop'].set()
+        stages = getattr(stage_metrics, 'stages', None)
+        if stages is not None:
+            totals = stages.setdefault(stage, {'stage': stage, 'calls': 0, 'seconds': 0.0, 'rows': 0, 'peak_memory_mb': 0.0})
+            totals['calls'] += 1
+            totals['seconds'] += time.perf_counter() - start
+            totals['rows'] += record['rows']
+            totals['peak_memory_mb'] = round(max(totals['peak_memory_mb'], record['peak_memory_mb']), 1)
+
+
+# Function to add to a count in the stage metrics, such as rows left out; counts have no
+# timing or memory, so those fields stay empty
+def count_stage_rows(stage, rows):
+    stages = getattr(stage_metrics, 'stages', None)
+    if stages is not None:
+        totals = stages.setdefault(stage, {'stage': stage, 'calls': 0, 'seconds': None, 'rows': 0, 'peak_memory_mb': None})
+        totals['calls'] += 1
+        totals['rows'] += rows
+
+
+# Function to time reading each chunk of a chunked CSV reader as the CSV load stage
+def track_chunks(chunks):
+    while True:
+        with track_stage('csv_load') as record:
+            chunk = next(chunks, None)
+            record['rows'] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+
+# Function to summarize the recorded stages with throughput
+def stage_metrics_report():
+    report = []
+    for totals in getattr(stage_metrics, 'stages', {}).values():
+        seconds = totals['seconds']
+        report.append({
+            **totals,
+            'seconds': None if seconds is None else round(seconds, 4),
+            'rows_per_sec': round(totals['rows'] / seconds) if seconds and totals['rows'] else None,
+        })
+    return report
+
+
+# Function to show the stage metrics in the results section, with a JSON download.
+# Pass a saved report to show the timings of an earlier run.
+def show_stage_metrics(report=None):
+    report = stage_metrics_report() if report is None else report
+    if not report:
+        return
+    st.subheader("Pipeline timings")
+    st.dataframe(pd.DataFrame(report))
+    st.download_button(
+        label="Download timings (JSON)", data=json.dumps(report, indent=2),
+        file_name="scrub_timings.json", mime="application/json"
+    )
+    st.subheader("Preprocessing rule hits (rows changed by each rule since the server started)")
+    st.dataframe(pd.DataFrame(preprocess_rule_report()))
+
+
+# Opt-in profiling of scrub runs with cProfile. PROFILE_SCRUBS=1 profiles every scrub, and the
+# UI can turn it on for one scrub; otherwise no profiler is created. The profile covers the
+# thread running the scrub, so while it is on parallel_process runs in that thread instead of
+# worker processes and normalization shows up in the report.
+profile_scrubs = os.getenv("PROFILE_SCRUBS", "0") != "0"
+profile_top_functions = int(os.getenv("PROFILE_TOP_FUNCTIONS", "30"))
+profiling_state = threading.local()
+
+
+# Context manager profiling its block when enabled and saving the stats to path
+@contextmanager
+def profile_run(path, enabled=True):
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Python 3.12+ allows one profiler at a time; the run goes on unprofiled
+        logger.warning("Not profiling this run: %s", e)
+        yield
+        return
+    profiling_state.active = True
+    try:
+        yield
+    finally:
+        profiling_state.active = False
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+# Function to list the functions of a saved profile with the most cumulative time
+def profile_report(path, limit=profile_top_functions):
+    report = []
+    for (file_name, line, function), (_, calls, own, cumulative, _) in pstats.Stats(path).stats.items():
+        report.append({
+            'function': function,
+            'location': f"{os.path.basename(file_name)}:{line}",
+            'calls': calls,
+            'own_seconds': round(own, 4),
+            'cumulative_seconds': round(cumulative, 4),
+        })
+    return sorted(report, key=lambda row: row['cumulative_seconds'], reverse=True)[:limit]
+
+
+# Function to show the top functions of a saved profile, with the raw profile and a text
+# report for download. The pstats file opens in snakeviz or python -m pstats.
+def show_profile(path):
+    st.subheader(f"Profile (top {profile_top_functions} functions by cumulative time)")
+    st.dataframe(pd.DataFrame(profile_report(path)), hide_index=True)
+    text_report = io.StringIO()
+    pstats.Stats(path, stream=text_report).sort_stats('cumulative').print_stats()
+    with open(path, 'rb') as profile_file:
+        st.download_button(label="Download profile (pstats)", data=profile_file,
+                           file_name="scrub_profile.pstats", mime="application/octet-stream")
+    st.download_button(label="Download profile (text)", data=text_report.getvalue(),
+                       file_name="scrub_profile.txt", mime="text/plain")
+
 def initialize_hits(conn):
     try:
         cur = conn.cursor()
@@ -32,91 +276,217 @@ def get_total_hits(conn):
         cur.execute("SELECT total_hits FROM hits_count ORDER BY id DESC LIMIT 1;")
         result = cur.fetchone()
         cur.close()
+        conn.commit()
         if result:
             return result[0]
         return 0
     except Exception as e:
         print(f"Error fetching total hits: {e}")
+        conn.rollback()
         return 0
+# Adds to the latest row in one statement, so concurrent scrubs cannot lose each other's hits.
+# Returns False if the update failed.
 def update_total_hits(conn, new_hits):
     try:
         cur = conn.cursor()
-
-        # Fetch the latest id
-        cur.execute("SELECT id FROM hits_count ORDER BY id DESC LIMIT 1;")
-        result = cur.fetchone()
-
-        if result:
-            latest_id = result[0]
-
-            # Update the total_hits of the row with the latest id
-            cur.execute("UPDATE hits_count SET total_hits = total_hits + %s WHERE id = %s;", (new_hits, latest_id))
-        else:
-            # If no rows exist, insert the first row with the current hit count
-            cur.execute("INSERT INTO hits_count (total_hits) VALUES (%s);", (new_hits,))
-
+        cur.execute("""
+            WITH updated AS (
+                UPDATE hits_count SET total_hits = total_hits + %(hits)s
+                WHERE id = (SELECT max(id) FROM hits_count)
+                RETURNING id
+            )
+            INSERT INTO hits_count (total_hits)
+            SELECT %(hits)s WHERE NOT EXISTS (SELECT 1 FROM updated);
+        """, {'hits': new_hits})
         conn.commit()
         cur.close()
+        return True
     except Exception as e:
         print(f"Error updating total hits: {e}")
+        if not conn.closed:
+            conn.rollback()
+        return False
+
+
+def postgres_connection_params():
+    return dict(
+        host=os.getenv("POSTGRES_HOST"),
+        database=os.getenv("POSTGRES_DB"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        port=os.getenv("POSTGRES_PORT"),
+        sslmode=os.getenv("POSTGRES_SSLMODE")
+    )
 
 
 # Connect to PostgreSQL Database
 def connect_to_postgres():
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("POSTGRES_HOST"),
-            database=os.getenv("POSTGRES_DB"),
-            user=os.getenv("POSTGRES_USER"),
-            password=os.getenv("POSTGRES_PASSWORD"),
-            port=os.getenv("POSTGRES_PORT"),
-            sslmode=os.getenv("POSTGRES_SSLMODE")
-        )
+        conn = psycopg2.connect(**postgres_connection_params())
         return conn
     except Exception as e:
         st.error(f"Error connecting to PostgreSQL: {e}")
         return None
+
+
+# Connections are pooled for the whole server; st.cache_resource keeps the pool across reruns
+# and sessions instead of opening a new TLS connection for every query. It only caches inside
+# a Streamlit server, so lru_cache keeps the shared objects for scripts like scrub_cli.py.
+postgres_pool_size = int(os.getenv("POSTGRES_POOL_SIZE", "5"))
+
+
+@st.cache_resource(show_spinner=False)
+@lru_cache(maxsize=None)
+def get_postgres_pool():
+    return psycopg2.pool.ThreadedConnectionPool(1, postgres_pool_size, **postgres_connection_params())
+
+
+# Context manager lending a pooled connection, or None when the database is unavailable
+@contextmanager
+def postgres_connection():
+    try:
+        pool = get_postgres_pool()
+        conn = pool.getconn()
+    except Exception as e:
+        print(f"Error connecting to PostgreSQL: {e}")
+        yield None
+        return
+    try:
+        yield conn
+    finally:
+        # Broken connections are dropped instead of being handed out again
+        pool.putconn(conn, close=bool(conn.closed))
+
+
 def increment_hit_counter():
-    conn = connect_to_postgres()
-    if conn:
-        cur = conn.cursor()
+    with postgres_connection() as conn:
+        if conn:
+            cur = conn.cursor()
 
-        # Check if the hit counter row exists, if not, create one
-        cur.execute("SELECT count FROM hit_counter LIMIT 1;")
-        result = cur.fetchone()
-        if result is None:
-            cur.execute("INSERT INTO hit_counter (count) VALUES (1);")
-            new_count = 1
-        else:
-            current_count = result[0]
-            new_count = current_count + 1
-            cur.execute("UPDATE hit_counter SET count = %s WHERE id = 1;", (new_count,))
+            # Create the hit counter row or increment it in one statement
+            cur.execute("""
+                INSERT INTO hit_counter (id, count) VALUES (1, 1)
+                ON CONFLICT (id) DO UPDATE SET count = hit_counter.count + 1
+                RETURNING count;
+            """)
+            new_count = cur.fetchone()[0]
 
-        conn.commit()
-        cur.close()
-        conn.close()
+            conn.commit()
+            cur.close()
 
-        return new_count
+            return new_count
 
 # Retrieve the current hit counter value
 def get_hit_counter():
-    conn = connect_to_postgres()
-    if conn:
-        cur = conn.cursor()
+    with postgres_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+
+            # Fetch the current hit count
+            cur.execute("SELECT count FROM hit_counter WHERE id = 1;")
+            result = cur.fetchone()
+            cur.close()
+            conn.commit()
+
+            if result is None:
+                return 0
+            return result[0]
+    return 0
 
-        # Fetch the current hit count
-        cur.execute("SELECT count FROM hit_counter LIMIT 1;")
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
 
-        if result is None:
-            return 0
-        return result[0]
-    return 0
-def parallel_process(df, func, column_name, new_column_name):
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        df[new_column_name] = list(executor.map(func, df[column_name]))
+# Hit counts are written by a background thread, so scrubs never wait on the database.
+# Increments queued while a write is in flight are summed into the next one, and a failed
+# write is retried with backoff, keeping the increments queued meanwhile.
+hit_counter_max_retry_seconds = float(os.getenv("HIT_COUNTER_MAX_RETRY_SECONDS", "60"))
+
+
+# Function to sum the increments waiting in the queue; returns (hits, number of increments)
+def drain_hit_counter_queue(hit_queue):
+    hits = batched = 0
+    while True:
+        try:
+            hits += hit_queue.get_nowait()
+            batched += 1
+        except queue.Empty:
+            return hits, batched
+
+
+def write_hit_counter_batches(hit_queue):
+    while True:
+        pending, batched = hit_queue.get(), 1
+        more_hits, more_batched = drain_hit_counter_queue(hit_queue)
+        pending, batched = pending + more_hits, batched + more_batched
+        delay = 1
+        while True:
+            with postgres_connection() as conn:
+                if conn is not None and update_total_hits(conn, pending):
+                    break
+            time.sleep(delay)
+            delay = min(delay * 2, hit_counter_max_retry_seconds)
+            more_hits, more_batched = drain_hit_counter_queue(hit_queue)
+            pending, batched = pending + more_hits, batched + more_batched
+        for _ in range(batched):
+            hit_queue.task_done()
+
+
+# Function to start the writer thread once per server and return its queue
+@st.cache_resource(show_spinner=False)
+@lru_cache(maxsize=None)
+def get_hit_counter_queue():
+    hit_queue = queue.Queue()
+    threading.Thread(target=write_hit_counter_batches, args=(hit_queue,), name='hit-counter-writer', daemon=True).start()
+    return hit_queue
+
+
+# Function to add hits to the total without blocking
+def record_hits(new_hits):
+    if new_hits:
+        get_hit_counter_queue().put(new_hits)
+
+
+# Function to wait until queued hits are written; returns False if some are still pending
+def flush_hit_counter(timeout=30):
+    hit_queue = get_hit_counter_queue()
+    deadline = time.monotonic() + timeout
+    while hit_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return not hit_queue.unfinished_tasks
+
+
+# Worker processes for sharded normalization. Streamlit runs this file as __main__, which
+# child processes cannot look functions up in, so workers import it as a regular module.
+# A forkserver with the module preloaded compiles the rule tables once; each worker forked
+# from it starts with them ready.
+normalization_workers = int(os.getenv("NORMALIZATION_WORKERS", str(os.cpu_count() or 1)))
+parallel_min_rows = int(os.getenv("PARALLEL_MIN_ROWS", "200000"))
+worker_module_name = os.path.splitext(os.path.basename(__file__))[0]
+
+
+def get_worker_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([worker_module_name])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def get_worker_function(func):
+    if __name__ == worker_module_name:
+        return func
+    return getattr(importlib.import_module(worker_module_name), func.__name__)
+
+
+# Function to apply an array-to-array function over large contiguous shards in worker processes,
+# returning the results in order. Small inputs, a single worker or a profiled run run serially.
+def parallel_process(values, func, workers=None, min_rows=None):
+    workers = normalization_workers if workers is None else workers
+    min_rows = parallel_min_rows if min_rows is None else min_rows
+    if workers <= 1 or len(values) < min_rows or getattr(profiling_state, 'active', False):
+        return func(values)
+
+    shards = np.array_split(values, workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=get_worker_context()) as executor:
+        return np.concatenate(list(executor.map(get_worker_function(func), shards)))
 
 
 # Compile the regex patterns beforehand
@@ -374,71 +744,155 @@ ordinal_mapping = {
 }
 
 
+# Token dictionaries compiled from the pattern tables above.
+# Every pattern has the form r'\btoken\b\.?', so a word matches it exactly when the
+# leading run of word characters in the word is that token. This lets
+# standardize_and_normalize_address look a word up once instead of trying every regex.
+rule_token_pattern = re.compile(r'\\b(\w+)\\b\\\.\?')
+leading_word_pattern = re.compile(r'\w+')
+hash_before_number_pattern = re.compile(r'\s*#\s*(?=\d*\s|$)')
+
+
+# Function to map each token (with or without a trailing period) to its first matching rule
+def build_token_dictionary(patterns):
+    tokens = {}
+    for pattern, replacement in patterns:
+        token = rule_token_pattern.fullmatch(pattern.pattern).group(1).lower()
+        # Keep the first pattern for a token, like the original first-match scan
+        tokens.setdefault(token, (pattern, replacement))
+        tokens.setdefault(token + '.', (pattern, replacement))
+    return tokens
+
+
+# Function to index multi-word ordinals by their first word
+def build_ordinal_phrase_trie(mapping):
+    trie = {}
+    for phrase, ordinal in mapping.items():
+        if ' ' in phrase:
+            first_word, rest = phrase.split(' ', 1)
+            trie.setdefault(first_word, {})[rest] = ordinal
+    return trie
+
+
+address_tokens = build_token_dictionary(address_patterns)
+directional_tokens = build_token_dictionary(directional_patterns.items())
+ordinal_phrase_trie = build_ordinal_phrase_trie(ordinal_mapping)
+
+
+# Function to find the rule whose token is the leading word of a word
+def match_rule(word, tokens, patterns):
+    if word in tokens:
+        return tokens[word]
+    if not word.isascii():
+        # Unicode case folding can differ from str.lower(), so fall back to the regex scan
+        for pattern, replacement in patterns:
+            if pattern.match(word):
+                return pattern, replacement
+        return None
+    leading_word = leading_word_pattern.match(word)
+    if leading_word:
+        return tokens.get(leading_word.group().lower())
+    return None
+
+
+# Function to return the (address rule, directional rule) matching a word, or None for each
+@lru_cache(maxsize=65536)
+def classify_word(word):
+    return (
+        match_rule(word, address_tokens, address_patterns),
+        match_rule(word, directional_tokens, directional_patterns.items()),
+    )
+
+
 def clean_full_zip(zip_code):
     zip_code = str(zip_code).replace(',', '').replace('.0', '')
     return zip_code[:5]  # Only keep the first 5 digits
 
-def preprocess_address(address):
-    # Standardize unit labels
-    def standardize_unit_label(unit_label):
-        unit_label = unit_label.strip().lower()
-        if unit_label in ['apt', 'unit', '#', 'suite', 'bldg', 'building']:
-            return 'Unit'
-        return unit_label
-
-    # 3. Remove the # symbol and dash before numbers (e.g., "Apt #-123" -> "Apt 123")
-    address = re.sub(r'#-?\s*(\d+)', r'\1', address)
-
-    # Convert the address to lowercase for consistent processing
-    address = address.lower().strip()
+# Preprocessing rules, applied in order to the lowercased, stripped address. A 'sub' rule
+# rewrites every match and moves on to the next rule; a 'return' rule passes its match to a
+# rewrite function and, unless that returns None, ends preprocessing with the result.
+# A rule with guard substrings is skipped when the address contains none of them, which saves
+# the regex call on most rows. Patterns are valid for both re and RE2, so
+# preprocess_address_array runs the same table.
+def rewrite_duplex_range(match):
+    # "5800 Hunting Hollow Ct 5802" -> "5800-5802 Hunting Hollow Ct"
+    num1 = int(match.group('num1'))
+    num2 = int(match.group('num2'))
+    if abs(num1 - num2) in [2, 4, 6, 8]:
+        log_sampled("Transforming %s to %s-%s %s", match.string, num1, num2, match.group('street').strip())
+        return f"{num1}-{num2} {match.group('street').strip()}"
+    log_sampled("Numbers %s and %s do not differ by 2, 4, 6 or 8. Keeping original format.", num1, num2)
+    return None
 
-    # Handle duplex/triplex/quadruplex pattern: "5800 Hunting Hollow Ct 5802" -> "5800-5802 Hunting Hollow Ct"
-    duplex_pattern = re.compile(r'^(\d+)\s+([\w\s]+)\s+(\d+)$', re.IGNORECASE)
-    duplex_match = duplex_pattern.match(address)
-    if duplex_match:
-        num1 = int(duplex_match.group(1))
-        num2 = int(duplex_match.group(3))
-        street_name = duplex_match.group(2).strip()
-        if abs(num1 - num2) in [2, 4,6, 8]:
-            print(f"Transforming {address} to {num1}-{num2} {street_name}")
-            return f"{num1}-{num2} {street_name}"
-        else:
-            print(f"Numbers {num1} and {num2} do not differ by 2, 4, or 8. Keeping original format.")
-    else:
-        print(f"No duplex match found for address: {address}")
-
-    # Handle state route pattern: "1230 - 123 N state Rte" -> "1230 N state Rte 123"
-    state_route_pattern = re.compile(r'^(\d+)\s*-\s*(\d+)\s*([NSEW]?)\s*(state\s+rte|state\s+route|state\s+rt)', re.IGNORECASE)
-    state_route_match = state_route_pattern.match(address)
-    if state_route_match:
-        num1 = state_route_match.group(1)
-        num2 = state_route_match.group(2)
-        direction = state_route_match.group(3).strip()
-        route_type = state_route_match.group(4).strip()
-        if direction:
-            new_address = f"{num1} {direction} {route_type} {num2}"
-        else:
-            new_address = f"{num1} {route_type} {num2}"
-        print(f"Transforming {address} to {new_address}")
-        return new_address
 
-    # 4. Convert "456 Maple Ave 34-Unit" to "456 Maple Ave Unit 34"
-    address = re.sub(r'(\d+)-unit', r'unit \1', address)
+def rewrite_state_route(match):
+    # "1230 - 123 N state Rte" -> "1230 N state Rte 123"
+    parts = [match.group('num1'), match.group('direction').strip(), match.group('route_type').strip(), match.group('num2')]
+    new_address = ' '.join(part for part in parts if part)
+    log_sampled("Transforming %s to %s", match.string, new_address)
+    return new_address
+
+
+PREPROCESS_RULES = [
+    # (rule id, kind, pattern, replacement or rewrite function, guard substrings)
+    # "Apt #-123" -> "Apt 123"
+    ('hash_before_number', 'sub', r'#-?\s*(\d+)', r'\1', ('#',)),
+    ('duplex_range', 'return', r'^(?P<num1>\d+)\s+(?P<street>[\w\s]+)\s+(?P<num2>\d+)$', rewrite_duplex_range, None),
+    ('state_route', 'return',
+     r'(?i)^(?P<num1>\d+)\s*-\s*(?P<num2>\d+)\s*(?P<direction>[NSEW]?)\s*(?P<route_type>state\s+rte|state\s+route|state\s+rt)',
+     rewrite_state_route, ('state',)),
+    # "456 Maple Ave 34-Unit" -> "456 Maple Ave Unit 34"
+    ('number_unit', 'sub', r'(\d+)-unit', r'unit \1', ('-unit',)),
+    # State routes without a direction (already covered above)
+    ('state_route_no_direction', 'sub', r'(\d+)-(\d+)\s+(state\s+rte|state\s+route|state\s+rt)', r'\1 \3 \2', ('state',)),
+    # "123 Main St 12-A" -> "123 Main St 12A"
+    ('number_letter', 'sub', r'(\d+)-([a-zA-Z])$', r'\1\2', ('-',)),
+    # Remove "Complex A" or "Building B" from any part of the address
+    ('complex_building', 'sub', r'(?i),?\s*(complex|building)\s+[a-z]', '', ('complex', 'building')),
+]
+preprocess_rules = [
+    (rule_id, kind, re.compile(pattern), action, guard) for rule_id, kind, pattern, action, guard in PREPROCESS_RULES
+]
+preprocess_rule_patterns = {rule_id: pattern for rule_id, _, pattern, _, _ in PREPROCESS_RULES}
 
-    # 5. State-route adjusting for addresses without direction (already covered above)
-    address = re.sub(r'(\d+)-(\d+)\s+(state\s+rte|state\s+route|state\s+rt)', r'\1 \3 \2', address)
+# Rows each preprocessing rule has changed in this process, for profiling which rules fire.
+# Rows normalized in worker processes or served from the normalization cache are not counted.
+preprocess_rule_hits = Counter()
+preprocess_rule_hits_lock = threading.Lock()
 
-    # 7. Remove dash in "123 Main St 12-A" -> "123 Main St 12A"
-    address = re.sub(r'(\d+)-([a-zA-Z])$', r'\1\2', address)
 
-    # 8. Remove "Complex A" or "Building B" from any part of the address
-    address = re.sub(r',?\s*(complex|building)\s+[a-z]', '', address, flags=re.IGNORECASE)
+def count_rule_hits(hits):
+    with preprocess_rule_hits_lock:
+        preprocess_rule_hits.update(hits)
 
-    # Return the address unchanged if no patterns matched
-    return address
 
+# Function to list the rows each preprocessing rule has changed so far, in rule order
+def preprocess_rule_report():
+    with preprocess_rule_hits_lock:
+        return [{'rule': rule_id, 'kind': kind, 'rows': preprocess_rule_hits[rule_id]} for rule_id, kind, *_ in PREPROCESS_RULES]
 
 
+def preprocess_address(address):
+    # Convert the address to lowercase for consistent processing
+    address = address.lower().strip()
+    hits = {}
+    for rule_id, kind, pattern, action, guard in preprocess_rules:
+        if guard and not any(token in address for token in guard):
+            continue
+        if kind == 'return':
+            match = pattern.match(address)
+            new_address = action(match) if match else None
+            if new_address is not None:
+                hits[rule_id] = 1
+                address = new_address
+                break
+        else:
+            address, count = pattern.subn(action, address)
+            if count:
+                hits[rule_id] = 1
+    if hits:
+        count_rule_hits(hits)
+    return address
 
 
 @lru_cache(maxsize=128)
@@ -502,34 +956,91 @@ def to_title_case(text):
 
 # Function to map columns automatically
 
+# Offline ZIP -> city index built from a reference file, so city correction does not need
+# one HTTP request per ZIP. Stored as an Arrow file sorted by ZIP and memory-mapped on load.
+zip_city_index_path = os.getenv("ZIP_CITY_INDEX_PATH", "zip_city_index.arrow")
+zip_city_http_fallback = os.getenv("ZIP_CITY_HTTP_FALLBACK", "1") != "0"
+ZIP_COLUMN_VARIATIONS = ['zip', 'zip code', 'zipcode', 'zip5', 'postal code']
+CITY_COLUMN_VARIATIONS = ['city', 'place name', 'primary city', 'default city']
+
+
+# Function to clean a whole ZIP column like clean_zip followed by clean_full_zip
+def clean_zip_series(series):
+    codes, uniques = pd.factorize(series.astype(str))
+    zip_codes = pd.Series(uniques, dtype=object)
+    for _ in range(2):
+        zip_codes = zip_codes.str.replace(',', '', regex=False).str.replace('.0', '', regex=False)
+    return pd.Series(zip_codes.str[:5].to_numpy()[codes], index=series.index, name=series.name)
+
+
+# Function to build the ZIP -> city index from a CSV with ZIP and city columns
+def build_zip_city_index(reference_file, path=zip_city_index_path):
+    reference_df = pd.read_csv(reference_file, dtype=str)
+    columns = create_standardized_column_map(reference_df.columns)
+    zip_col = next((columns[var] for var in ZIP_COLUMN_VARIATIONS if var in columns), None)
+    city_col = next((columns[var] for var in CITY_COLUMN_VARIATIONS if var in columns), None)
+    if zip_col is None or city_col is None:
+        raise ValueError(f"Could not find ZIP and city columns in {list(reference_df.columns)}")
+
+    # The first city listed for a ZIP wins, like the first place returned by the API
+    index_df = pd.DataFrame({'zip': clean_zip_series(reference_df[zip_col]), 'city': reference_df[city_col]})
+    index_df = index_df.dropna().drop_duplicates(subset='zip').sort_values('zip')
+    table = pa.Table.from_pandas(index_df, preserve_index=False)
+    with pa.OSFile(path + '.tmp', 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(path + '.tmp', path)
+    return len(index_df)
+
+
+# Function to memory-map the ZIP index, or None when it has not been built
+def load_zip_city_index(path=zip_city_index_path):
+    try:
+        return pa.ipc.open_file(pa.memory_map(path)).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+# Function to look up the city of every cleaned ZIP in a column (None where unknown)
+def lookup_cities(zip_codes, path=zip_city_index_path):
+    zip_index = load_zip_city_index(path)
+    if zip_index is None:
+        return pd.Series(None, index=zip_codes.index, dtype=object)
+    positions = pc.index_in(pa.array(zip_codes, type=pa.string()), value_set=zip_index['zip'])
+    cities = zip_index['city'].take(positions).to_numpy(zero_copy_only=False)
+    return pd.Series(cities, index=zip_codes.index, dtype=object)
+
+
+# Function to resolve cities from the local index, asking the API only for ZIPs it lacks
+def resolve_cities(zip_codes):
+    codes, uniques = pd.factorize(zip_codes)
+    unique_zip_codes = pd.Series(uniques, dtype=object)
+    cities = lookup_cities(unique_zip_codes)
+    missing_zip_codes = unique_zip_codes[cities.isna()]
+    if zip_city_http_fallback and len(missing_zip_codes):
+        city_map = fetch_city_map(missing_zip_codes.tolist())
+        cities = cities.fillna(unique_zip_codes.map(city_map))
+    # NaN ZIPs have code -1 and get no city
+    resolved = np.append(cities.to_numpy(dtype=object), None)[codes]
+    return pd.Series(resolved, index=zip_codes.index, dtype=object)
+
+
 # Function to adjust cities based on ZIP codes
 def adjust_cities(df, mapped_columns):
-    def clean_zip(zip_code):
-        return str(zip_code).replace(',', '').replace('.0', '')
-
     if mapped_columns['property_zip'] != 'none' and mapped_columns['property_city'] != 'none':
         property_zip_col = mapped_columns['property_zip']
         property_city_col = mapped_columns['property_city']
 
         # Clean and convert the property ZIP codes to strings
-        df[property_zip_col] = df[property_zip_col].apply(clean_zip)
-        df[property_zip_col] = df[property_zip_col].apply(clean_full_zip)
-        zip_codes = df[property_zip_col].unique()
-        city_map = fetch_city_map(zip_codes)
-
-        df[property_city_col] = df[property_zip_col].map(city_map).fillna(df[property_city_col])
+        df[property_zip_col] = clean_zip_series(df[property_zip_col])
+        df[property_city_col] = resolve_cities(df[property_zip_col]).fillna(df[property_city_col])
 
     if mapped_columns['mailing_zip'] != 'none' and mapped_columns['mailing_city'] != 'none':
         mailing_zip_col = mapped_columns['mailing_zip']
         mailing_city_col = mapped_columns['mailing_city']
 
         # Clean and convert the mailing ZIP codes to strings
-        df[mailing_zip_col] = df[mailing_zip_col].apply(clean_zip)
-        df[mailing_zip_col] = df[mailing_zip_col].apply(clean_full_zip)
-        zip_codes = df[mailing_zip_col].unique()
-        city_map = fetch_city_map(zip_codes)
-
-        df[mailing_city_col] = df[mailing_zip_col].map(city_map).fillna(df[mailing_city_col])
+        df[mailing_zip_col] = clean_zip_series(df[mailing_zip_col])
+        df[mailing_city_col] = resolve_cities(df[mailing_zip_col]).fillna(df[mailing_city_col])
 
     return df
 
@@ -541,7 +1052,7 @@ def adjust_cities(df, mapped_columns):
 def standardize_and_normalize_address(address):
     if isinstance(address, str):
         # Remove '#' symbols followed by numbers
-        address = re.sub(r'\s*#\s*(?=\d*\s|$)', ' ', address)
+        address = hash_before_number_pattern.sub(' ', address)
         # Convert to lower case
         address = address.lower()
         # Split into words
@@ -550,9 +1061,9 @@ def standardize_and_normalize_address(address):
         # Replace multi-word ordinal phrases
         i = 0
         while i < len(words) - 1:
-            two_word = f"{words[i]} {words[i + 1]}"
-            if two_word in ordinal_mapping:
-                words[i] = ordinal_mapping[two_word]
+            next_words = ordinal_phrase_trie.get(words[i])
+            if next_words and words[i + 1] in next_words:
+                words[i] = next_words[words[i + 1]]
                 del words[i + 1]
             else:
                 i += 1
@@ -560,36 +1071,28 @@ def standardize_and_normalize_address(address):
         # Replace single-word ordinals
         words = [ordinal_mapping.get(word, word) for word in words]
 
-        # Reconstruct the address after ordinal replacement
-        address = ' '.join(words)
-
         # Replace address patterns
-        words = address.split()
+        rules = [classify_word(word) for word in words]
         last_index_to_replace = None
 
         # Track the last index of an address pattern match
-        for i, word in enumerate(words):
-            for pattern, replacement in address_patterns:
-                if pattern.match(word):
-                    last_index_to_replace = i
+        for i, (address_rule, _) in enumerate(rules):
+            if address_rule is not None:
+                last_index_to_replace = i
 
         # Replace the last occurrence of the address pattern
         if last_index_to_replace is not None:
-            for pattern, replacement in address_patterns:
-                if pattern.match(words[last_index_to_replace]):
-                    words[last_index_to_replace] = pattern.sub(replacement, words[last_index_to_replace])
-                    break
+            pattern, replacement = rules[last_index_to_replace][0]
+            words[last_index_to_replace] = pattern.sub(replacement, words[last_index_to_replace])
+            rules[last_index_to_replace] = classify_word(words[last_index_to_replace])
 
         # Replace directional patterns unless followed by an address pattern
-        for i, word in enumerate(words):
-            for pattern, replacement in directional_patterns.items():
-                if pattern.match(word):
-                    if i + 1 < len(words):
-                        next_word = words[i + 1]
-                        if any(addr_pattern.match(next_word) for addr_pattern, _ in address_patterns):
-                            continue
-                    words[i] = pattern.sub(replacement, words[i])
-                    break
+        for i, (_, directional_rule) in enumerate(rules):
+            if directional_rule is not None:
+                if i + 1 < len(words) and rules[i + 1][0] is not None:
+                    continue
+                pattern, replacement = directional_rule
+                words[i] = pattern.sub(replacement, words[i])
 
         # Reconstruct the address
         address = ' '.join(words)
@@ -597,6 +1100,333 @@ def standardize_and_normalize_address(address):
     return address
 
 
+# Column kernels for the same rules, run with pyarrow.compute (RE2) instead of per-row Python.
+# RE2 classes are ASCII-only, so rows outside this character set (or with numbers too long
+# for int64) go through the scalar functions to keep the output identical.
+vectorizable_address_pattern = r'^[\t\n\f\r\x20-\x7e]*$'
+long_number_pattern = r'\d{19}'
+space_separator = pa.scalar(' ', type=pa.large_string())
+dash_separator = pa.scalar('-', type=pa.large_string())
+
+
+# Function to run extract_regex only on rows the cheaper match kernel accepts
+def extract_matching(addresses, pattern):
+    matches = pc.match_substring_regex(addresses, pattern)
+    return pc.extract_regex(pc.if_else(matches, addresses, pa.scalar(None, type=addresses.type)), pattern)
+
+
+# Function to apply preprocess_address to a whole pyarrow string array, rule by rule
+def preprocess_address_array(addresses):
+    addresses = pc.ascii_trim_whitespace(pc.ascii_lower(addresses))
+    result = addresses
+    active = pc.is_valid(addresses)
+    hits = {}
+    for rule_id, kind, _, action, _ in preprocess_rules:
+        if kind == 'sub':
+            rewritten = pc.replace_substring_regex(addresses, preprocess_rule_patterns[rule_id], action)
+            # Rows already rewritten by an exit rule do not count
+            hits[rule_id] = pc.sum(pc.and_(pc.not_equal(rewritten, addresses), active)).as_py() or 0
+            addresses = rewritten
+            continue
+
+        # Exit rules: rows they rewrite keep that result and skip the remaining rules
+        if rule_id == 'duplex_range':
+            duplex = extract_matching(addresses, preprocess_rule_patterns[rule_id])
+            num1 = pc.cast(pc.struct_field(duplex, 'num1'), pa.int64())
+            num2 = pc.cast(pc.struct_field(duplex, 'num2'), pa.int64())
+            fired = pc.fill_null(pc.is_in(pc.abs(pc.subtract(num1, num2)), value_set=pa.array([2, 4, 6, 8])), False)
+            rewritten = pc.binary_join_element_wise(
+                pc.binary_join_element_wise(pc.cast(num1, pa.large_string()), pc.cast(num2, pa.large_string()), dash_separator),
+                pc.ascii_trim_whitespace(pc.struct_field(duplex, 'street')),
+                space_separator
+            )
+        elif rule_id == 'state_route':
+            state_route = extract_matching(addresses, preprocess_rule_patterns[rule_id])
+            fired = pc.is_valid(state_route)
+            direction = pc.struct_field(state_route, 'direction')
+            route_fields = [pc.struct_field(state_route, name) for name in ('num1', 'direction', 'route_type', 'num2')]
+            rewritten = pc.if_else(
+                pc.equal(direction, ''),
+                pc.binary_join_element_wise(route_fields[0], route_fields[2], route_fields[3], space_separator),
+                pc.binary_join_element_wise(*route_fields, space_separator)
+            )
+        else:
+            raise ValueError(f"No column kernel for preprocessing rule {rule_id}")
+        fired = pc.and_(fired, active)
+        hits[rule_id] = pc.sum(fired).as_py() or 0
+        result = pc.if_else(fired, rewritten, result)
+        active = pc.and_(active, pc.invert(fired))
+
+    count_rule_hits(hits)
+    return pc.if_else(active, addresses, result)
+
+
+# Function to replace the words at the given positions using the address (0) or directional (1) rule
+def substitute_words(codes, positions, vocab, rules, rule_index):
+    replaced_codes = {}
+    for code in np.unique(codes[positions]):
+        pattern, replacement = rules[code][rule_index]
+        vocab.append(pattern.sub(replacement, vocab[code]))
+        rules.append(classify_word(vocab[-1]))
+        replaced_codes[code] = len(vocab) - 1
+    code_map = np.arange(len(vocab))
+    code_map[list(replaced_codes)] = list(replaced_codes.values())
+    codes[positions] = code_map[codes[positions]]
+
+
+# Function to apply standardize_and_normalize_address to a whole pyarrow string array.
+# Returns the standardized array and the rows that must be redone with the scalar function.
+def standardize_address_array(addresses):
+    # Same tokens as removing '#' before numbers, since whitespace is collapsed by the split
+    addresses = pc.replace_substring_regex(addresses, r'#(\d*\s|$)', r' \1')
+    words = pc.ascii_split_whitespace(pc.ascii_trim_whitespace(pc.ascii_lower(addresses)))
+
+    lengths = pc.list_value_length(words).to_numpy(zero_copy_only=False).astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    encoded = pc.dictionary_encode(pc.list_flatten(words))
+    codes = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+    vocab = encoded.dictionary.to_pylist()
+
+    same_row_next = np.zeros(len(codes), dtype=bool)
+    same_row_next[:-1] = rows[:-1] == rows[1:]
+
+    # Multi-word ordinal phrases are rare, so those rows keep the scalar path
+    is_phrase_start = np.array([word in ordinal_phrase_trie for word in vocab], dtype=bool)[codes]
+    fallback_rows = np.unique(rows[is_phrase_start & same_row_next])
+
+    # Canonicalize each distinct word once
+    vocab = [ordinal_mapping.get(word, word) for word in vocab]
+    rules = [classify_word(word) for word in vocab]
+
+    # Replace the last address pattern match in each row
+    has_address_rule = np.array([rule[0] is not None for rule in rules], dtype=bool)
+    is_address = has_address_rule[codes]
+    last_index = np.full(len(lengths), -1, dtype=np.int64)
+    np.maximum.at(last_index, rows[is_address], np.flatnonzero(is_address))
+    substitute_words(codes, last_index[last_index >= 0], vocab, rules, 0)
+
+    # Replace directional patterns unless followed by an address pattern
+    has_address_rule = np.array([rule[0] is not None for rule in rules], dtype=bool)
+    has_directional_rule = np.array([rule[1] is not None for rule in rules], dtype=bool)
+    next_is_address = np.zeros(len(codes), dtype=bool)
+    next_is_address[:-1] = same_row_next[:-1] & has_address_rule[codes[1:]]
+    substitute_words(codes, np.flatnonzero(has_directional_rule[codes] & ~next_is_address), vocab, rules, 1)
+
+    flat_words = pa.array(vocab, type=pa.large_string()).take(pa.array(codes))
+    words = pa.LargeListArray.from_arrays(pa.array(offsets, type=pa.int64()), flat_words)
+    return pc.binary_join(words, space_separator), fallback_rows
+
+
+# Function to normalize an array of address strings with the column kernels
+def compute_normalized_addresses(addresses):
+    values = pa.array(addresses, type=pa.large_string())
+    vectorizable = pc.and_(
+        pc.match_substring_regex(values, vectorizable_address_pattern),
+        pc.invert(pc.match_substring_regex(values, long_number_pattern))
+    ).to_numpy(zero_copy_only=False)
+    vector_rows = np.flatnonzero(vectorizable)
+    scalar_rows = np.flatnonzero(~vectorizable)
+
+    with track_stage('preprocess', len(vector_rows)):
+        preprocessed = preprocess_address_array(values.take(pa.array(vector_rows)))
+    standardized, fallback_rows = standardize_address_array(preprocessed)
+    vector_result = pc.ascii_lower(standardized).to_numpy(zero_copy_only=False)
+    for i in fallback_rows:
+        vector_result[i] = standardize_and_normalize_address(preprocessed[i].as_py()).lower()
+
+    normalized = np.empty(len(addresses), dtype=object)
+    normalized[vector_rows] = vector_result
+    for i in scalar_rows:
+        normalized[i] = standardize_and_normalize_address(preprocess_address(addresses[i])).lower()
+    return normalized
+
+
+# Persistent cache of raw address -> normalized address, shared by all scrubs on this machine.
+# The file is tagged with a hash of the rule tables, so editing any rule invalidates it.
+# New entries and the recency of cache hits are collected in memory and merged into the file
+# under a file lock once normalization_cache_flush_entries have built up, after
+# normalization_cache_flush_seconds, or when the process exits.
+normalization_cache_path = os.getenv("NORMALIZATION_CACHE_PATH", "normalization_cache.arrow")
+normalization_cache_max_entries = int(os.getenv("NORMALIZATION_CACHE_MAX_ENTRIES", "5000000"))
+normalization_cache_flush_entries = int(os.getenv("NORMALIZATION_CACHE_FLUSH_ENTRIES", "100000"))
+normalization_cache_flush_seconds = float(os.getenv("NORMALIZATION_CACHE_FLUSH_SECONDS", "60"))
+# Tables of new entries (raw, normalized, last_used) and of cache hits (raw, last_used) not yet written
+normalization_cache_pending = {'entries': [], 'hits': [], 'rows': 0, 'flushed': time.monotonic()}
+normalization_cache_lock = threading.Lock()
+normalization_cache_write_lock = threading.Lock()
+
+
+def compute_rules_version():
+    digest = hashlib.sha256()
+    for pattern, replacement in address_patterns:
+        digest.update(f"address\0{pattern.pattern}\0{replacement}\n".encode())
+    for pattern, replacement in directional_patterns.items():
+        digest.update(f"directional\0{pattern.pattern}\0{replacement}\n".encode())
+    for phrase, ordinal in ordinal_mapping.items():
+        digest.update(f"ordinal\0{phrase}\0{ordinal}\n".encode())
+    for rule_id, kind, pattern, action, _ in PREPROCESS_RULES:
+        digest.update(f"preprocess\0{rule_id}\0{kind}\0{pattern}\0{getattr(action, '__name__', action)}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+rules_version = compute_rules_version()
+
+
+# Function to load the normalization cache, or None if it is missing, corrupt or from other rules
+def load_normalization_cache(path):
+    try:
+        cache = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = cache.schema.metadata or {}
+    if metadata.get(b'rules_version') != rules_version.encode():
+        return None
+    return cache
+
+
+# Function to write the cache atomically, keeping only the most recently used entries
+def save_normalization_cache(path, cache, max_entries):
+    if cache.num_rows > max_entries:
+        newest = np.argsort(-cache['last_used'].to_numpy(), kind='stable')[:max_entries]
+        cache = cache.take(pa.array(newest))
+    cache = cache.replace_schema_metadata({'rules_version': rules_version})
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as sink, pa.ipc.new_file(sink, cache.schema) as writer:
+            writer.write_table(cache)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Error saving normalization cache: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# Context manager holding thread_lock and an exclusive lock on path + '.lock', so processes
+# sharing a file update it one at a time. Without fcntl only the threads of this process are serialized.
+@contextmanager
+def exclusive_file_lock(path, thread_lock):
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Function to merge new entries (raw, normalized, last_used) and hits (raw, last_used) into the
+# cache; entries another process has added meanwhile are kept
+def merge_normalization_cache(cache, entries, hits):
+    entries = entries.group_by('raw').aggregate([('normalized', 'max'), ('last_used', 'max')]).rename_columns(
+        ['raw', 'normalized', 'last_used'])
+    if cache is not None:
+        cache = cache.replace_schema_metadata(None)
+        entries = entries.filter(pc.invert(pc.is_in(entries['raw'], value_set=cache['raw'])))
+        entries = pa.concat_tables([cache, entries.select(cache.column_names).cast(cache.schema)])
+
+    hits = pa.concat_tables([hits, entries.select(['raw', 'last_used'])]).group_by('raw').aggregate([('last_used', 'max')])
+    positions = pc.index_in(hits['raw'], value_set=entries['raw'])
+    is_present = pc.is_valid(positions).to_numpy(zero_copy_only=False)
+    last_used = entries['last_used'].to_numpy().copy()
+    rows = pc.drop_null(positions).to_numpy()
+    last_used[rows] = np.maximum(last_used[rows], hits['last_used_max'].to_numpy()[is_present])
+    return entries.set_column(entries.schema.get_field_index('last_used'), 'last_used', pa.array(last_used))
+
+
+# Function to write the pending cache updates to the cache file, if any are due (or with force)
+def flush_normalization_cache(force=False):
+    with normalization_cache_lock:
+        pending = normalization_cache_pending
+        due = force or pending['rows'] >= normalization_cache_flush_entries or \
+            time.monotonic() - pending['flushed'] >= normalization_cache_flush_seconds
+        if not normalization_cache_path or not (pending['entries'] or pending['hits']) or not due:
+            return
+        entries, hits = pending['entries'], pending['hits']
+        pending.update(entries=[], hits=[], rows=0, flushed=time.monotonic())
+
+    entries = pa.concat_tables(entries) if entries else pa.table({
+        'raw': pa.array([], pa.large_string()), 'normalized': pa.array([], pa.large_string()),
+        'last_used': pa.array([], pa.int64()),
+    })
+    hits = pa.concat_tables(hits) if hits else entries.select(['raw', 'last_used'])
+    with exclusive_file_lock(normalization_cache_path, normalization_cache_write_lock):
+        cache = merge_normalization_cache(load_normalization_cache(normalization_cache_path), entries, hits)
+        save_normalization_cache(normalization_cache_path, cache, normalization_cache_max_entries)
+
+
+atexit.register(flush_normalization_cache, force=True)
+
+
+# Function to look up addresses in the cache file and the pending new entries; returns the
+# normalized addresses, None where not cached
+def lookup_normalization_cache(values):
+    normalized = np.empty(len(values), dtype=object)
+    in_file = np.zeros(len(values), dtype=bool)
+    cache = load_normalization_cache(normalization_cache_path)
+    if cache is not None:
+        positions = pc.index_in(values, value_set=cache['raw'])
+        in_file = pc.is_valid(positions).to_numpy(zero_copy_only=False)
+        normalized[in_file] = cache['normalized'].take(pc.drop_null(positions)).to_numpy(zero_copy_only=False)
+
+    with normalization_cache_lock:
+        pending_entries = list(normalization_cache_pending['entries'])
+    missing = np.flatnonzero(~in_file)
+    if pending_entries and len(missing):
+        pending = pa.concat_tables(pending_entries)
+        positions = pc.index_in(values.take(pa.array(missing)), value_set=pending['raw'])
+        in_pending = pc.is_valid(positions).to_numpy(zero_copy_only=False)
+        normalized[missing[in_pending]] = pending['normalized'].take(pc.drop_null(positions)).to_numpy(zero_copy_only=False)
+    return normalized
+
+
+# Function to normalize distinct addresses, reusing cached results from earlier runs
+def normalize_unique_addresses(addresses):
+    if not normalization_cache_path:
+        return parallel_process(addresses, compute_normalized_addresses)
+
+    values = pa.array(addresses, type=pa.large_string())
+    normalized = lookup_normalization_cache(values)
+    is_missing = pd.isna(normalized)
+    missing = np.flatnonzero(is_missing)
+    if len(missing):
+        normalized[missing] = parallel_process(addresses[missing], compute_normalized_addresses)
+
+    # Queue the new entries and the recency of the hits for the next flush
+    now = time.time_ns()
+    hits = np.flatnonzero(~is_missing)
+    with normalization_cache_lock:
+        pending = normalization_cache_pending
+        if len(missing):
+            pending['entries'].append(pa.table({
+                'raw': values.take(pa.array(missing)),
+                'normalized': pa.array(normalized[missing], type=pa.large_string()),
+                'last_used': pa.array(np.full(len(missing), now, dtype=np.int64)),
+            }))
+        if len(hits):
+            pending['hits'].append(pa.table({
+                'raw': values.take(pa.array(hits)),
+                'last_used': pa.array(np.full(len(hits), now, dtype=np.int64)),
+            }))
+        pending['rows'] += len(missing) + len(hits)
+    flush_normalization_cache()
+    return normalized
+
+
+# Function to normalize a whole address column, equivalent to
+# series.apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
+def normalize_address_series(series, normalize_unique=normalize_unique_addresses):
+    # Normalize each distinct address once and broadcast the results back to the rows
+    with track_stage('normalize', len(series)):
+        codes, uniques = pd.factorize(series.fillna('').astype(str))
+        normalized = normalize_unique(np.asarray(uniques, dtype=object))
+        return pd.Series(normalized[codes], index=series.index, name=series.name)
+
+
 
 
 def create_standardized_column_map(df_columns):
@@ -633,132 +1463,1678 @@ def auto_map_columns(df):
 
     return property_col, mailing_col
 
-# Function to load and combine multiple files
-def load_and_combine_files(uploaded_files):
-    combined_df = pd.DataFrame()
-    for uploaded_file in uploaded_files:
-        df = pd.read_csv(uploaded_file)
-        combined_df = pd.concat([combined_df, df], ignore_index=True)
-    return combined_df
+# Skip traced files are read with the pyarrow CSV reader, every column as string[pyarrow] so
+# values keep their text as written, with the same missing-value markers as pd.read_csv.
+csv_null_values = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+csv_read_workers = int(os.getenv("CSV_READ_WORKERS", "8"))
+
+
+# Function to read the column names of a CSV file from its first block
+def read_csv_columns(file):
+    if not isinstance(file, (str, os.PathLike)):
+        file.seek(0)
+    columns = pacsv.open_csv(file).schema.names
+    if not isinstance(file, (str, os.PathLike)):
+        file.seek(0)
+    return columns
+
+
+# Function to build the options reading every column of a CSV file as strings, optionally only some columns
+def csv_convert_options(file, columns=None):
+    return pacsv.ConvertOptions(
+        column_types={name: pa.string() for name in read_csv_columns(file)},
+        null_values=csv_null_values,
+        strings_can_be_null=True,
+        include_columns=columns,
+        include_missing_columns=columns is not None,
+    )
 
-# Function to perform scrubbing logic
-def scrub_data(needs_df, allskipped_df, scrub_on):
-    # Convert standardized columns to lowercase
 
+# Function to read a CSV file into an Arrow table of strings, optionally only some columns
+def read_csv_table(file, columns=None):
+    table = pacsv.read_csv(file, convert_options=csv_convert_options(file, columns))
+    if not isinstance(file, (str, os.PathLike)):
+        file.seek(0)
+    return table
+
+
+# Function to read files in parallel and concatenate them once into one table
+def read_csv_tables(files, columns=None):
+    with track_stage('csv_load') as record:
+        with ThreadPoolExecutor(max_workers=max(1, min(csv_read_workers, len(files)))) as executor:
+            tables = list(executor.map(lambda file: read_csv_table(file, columns), files))
+        # Files with different columns are aligned by name, missing ones filled with nulls
+        table = pa.concat_tables(tables, promote_options='default')
+        record['rows'] = table.num_rows
+    return table
+
+
+# Function to load and combine multiple files. With columns, only those columns are loaded
+# (projection); the rest can be fetched later with load_combined_rows for the rows that matter.
+def load_and_combine_files(uploaded_files, columns=None):
+    table = read_csv_tables(uploaded_files, columns)
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+
+
+# Function to load the full rows at the given positions of the combined files. The files are
+# streamed block by block and only the requested rows are kept, so memory holds one block and
+# the rows rather than the whole files.
+def load_combined_rows(uploaded_files, rows):
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(rows, kind='stable')
+    sorted_rows = rows[order]
+    pieces = []
+    offset = 0
+    with track_stage('csv_load') as record:
+        for file in uploaded_files:
+            reader = pacsv.open_csv(file, convert_options=csv_convert_options(file))
+            # An empty piece per file keeps its columns even when none of its rows are requested
+            pieces.append(reader.schema.empty_table())
+            for batch in reader:
+                start, end = np.searchsorted(sorted_rows, [offset, offset + batch.num_rows])
+                if end > start:
+                    pieces.append(pa.Table.from_batches([batch.take(pa.array(sorted_rows[start:end] - offset))]))
+                offset += batch.num_rows
+            if not isinstance(file, (str, os.PathLike)):
+                file.seek(0)
+        record['rows'] = len(rows)
+
+    # Put the rows back in the requested order
+    positions = np.empty(len(rows), dtype=np.int64)
+    positions[order] = np.arange(len(rows))
+    table = pa.concat_tables(pieces, promote_options='default').take(pa.array(positions))
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get).set_index(pd.Index(rows))
+
+# Function to identify an upload without reading its content: the uploader's file id and the size
+def upload_key(file):
+    return getattr(file, 'file_id', file.name), file.getbuffer().nbytes
+
+
+# Function to hash an upload's content once per session, when a scrub needs it
+def session_file_hash(file):
+    hashes = st.session_state.setdefault('upload_hashes', {})
+    key = upload_key(file)
+    if key not in hashes:
+        hashes[key] = file_content_hash(file)
+    return hashes[key]
+
+
+# Cached stages, so widget changes rerunning the script do not reload or renormalize the data.
+# Frames are keyed by upload_key, so reruns do not hash the whole upload; the underscore
+# arguments are not hashed.
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_csv_file(file_key, _file, nrows=None):
+    _file.seek(0)
+    with track_stage('csv_load') as record:
+        df = pd.read_csv(_file, nrows=nrows)
+        record['rows'] = len(df)
+    _file.seek(0)
+    return df
 
 
-    # Perform the merge based on selected condition
-    if scrub_on == 'Both':
-        allskipped_df['property_address'].fillna('', inplace=True)
-        allskipped_df['mailing_address'].fillna('', inplace=True)
-        needs_df['property_address'].fillna('', inplace=True)
-        needs_df['mailing_address'].fillna('', inplace=True)
-        allskipped_df['property_address'] = allskipped_df['property_address'].apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
-        allskipped_df['mailing_address'] = allskipped_df['mailing_address'].apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
-
-        needs_df['property_address'] = needs_df['property_address'].apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
-        needs_df['mailing_address'] = needs_df['mailing_address'].apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
-
-
-        needs_df['property_address'] = needs_df['property_address'].str.lower()
-        allskipped_df['mailing_address'] = allskipped_df['mailing_address'].str.lower()
-        hits_df = needs_df.merge(allskipped_df, on=['mailing_address', 'property_address'], how='inner')
-    elif scrub_on == 'Property Address':
-        allskipped_df['property_address'].fillna('', inplace=True)
-        needs_df['property_address'].fillna('', inplace=True)
-        allskipped_df['property_address'] = allskipped_df['property_address'].apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
-        needs_df['property_address'] = needs_df['property_address'].apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
-        hits_df = needs_df.merge(allskipped_df, on=['property_address'], how='inner')
-    elif scrub_on == 'Mailing Address':
-        allskipped_df['mailing_address'].fillna('', inplace=True)
-        needs_df['mailing_address'].fillna('', inplace=True)
-        allskipped_df['mailing_address'] = allskipped_df['mailing_address'].apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
-        needs_df['mailing_address'] = needs_df['mailing_address'].apply(preprocess_address).apply(standardize_and_normalize_address).str.lower()
-        hits_df = needs_df.merge(allskipped_df, on=['mailing_address'], how='inner')
+# Function to load the skip traced files for a scrub: combined, deduped on the auto-mapped and
+# then the chosen columns, and renamed to the standardized address columns. Scrubs share the
+# result through shared_suppression instead of caching a copy per session.
+def load_skip_traced(uploaded_files, auto_mapped_columns, combined_property_col, combined_mailing_col):
+    combined_df = load_and_combine_files(uploaded_files)
+    with track_stage('combine_dedupe', len(combined_df)):
+        for subset in [auto_mapped_columns, (combined_property_col, combined_mailing_col)]:
+            combined_df = combined_df.drop_duplicates(subset=[col for col in subset if col in combined_df.columns])
+    return combined_df.rename(columns={
+        combined_property_col: 'property_address',
+        combined_mailing_col: 'mailing_address'
+    })
+
+
+# Address columns each scrubbing condition matches on
+SCRUB_KEY_COLUMNS = {
+    'Both': ['mailing_address', 'property_address'],
+    'Property Address': ['property_address'],
+    'Mailing Address': ['mailing_address'],
+}
+
+
+# Fingerprints saved with the suppression index are tagged with the hashing scheme, since
+# hash_pandas_object may hash differently in another pandas version
+address_key_hash_scheme = f"hash_pandas_object/pandas-{pd.__version__}"
+
+
+# Function to hash the composite address key of each row into a 64-bit integer
+def hash_address_keys(df, key_columns):
+    return pd.util.hash_pandas_object(df[key_columns], index=False).to_numpy()
+
+
+# Function to build the sorted distinct key hashes of the skip traced rows, reusable across chunks
+def build_key_index(allskipped_df, key_columns):
+    return np.unique(hash_address_keys(allskipped_df, key_columns), return_index=True)
+
+
+# Function to find, for each needs row, the first skip traced row with the same key (-1 if none)
+def find_matching_rows(needs_df, allskipped_df, key_columns, key_index=None):
+    needs_hashes = hash_address_keys(needs_df, key_columns)
+    unique_hashes, first_rows = key_index if key_index is not None else build_key_index(allskipped_df, key_columns)
+    matched_rows = np.full(len(needs_df), -1, dtype=np.int64)
+    if len(unique_hashes) == 0:
+        return matched_rows
+
+    slots = np.searchsorted(unique_hashes, needs_hashes).clip(max=len(unique_hashes) - 1)
+    candidates = np.flatnonzero(unique_hashes[slots] == needs_hashes)
+    rows = first_rows[slots[candidates]]
+
+    # Confirm candidates on the address strings so a hash collision cannot create a false hit
+    is_same = np.ones(len(candidates), dtype=bool)
+    for column in key_columns:
+        is_same &= needs_df[column].to_numpy()[candidates] == allskipped_df[column].iloc[rows].to_numpy()
+    matched_rows[candidates[is_same]] = rows[is_same]
+    return matched_rows
+
+
+# Function to build the hits (needs rows joined to their matched skip traced rows) and the
+# remaining rows from the matched row of each needs row (-1 if none).
+# When allskipped_df is a projection of the key columns, load_rows(index labels) returns the
+# full skip traced rows, so the other columns are only loaded for the hits.
+def split_hits(needs_df, allskipped_df, key_columns, matched_rows, load_rows=None):
+    is_hit = matched_rows >= 0
+
+    # Attach the first matching skip traced row, so duplicates there do not multiply the hits
+    hits = needs_df[is_hit].reset_index(drop=True)
+    matches = allskipped_df.iloc[matched_rows[is_hit]]
+    if load_rows is not None:
+        matches = load_rows(matches.index.to_numpy())
+    matches = matches.drop(columns=key_columns).reset_index(drop=True)
+    overlap = hits.columns.intersection(matches.columns)
+    hits_df = pd.concat([
+        hits.rename(columns={col: f"{col}_x" for col in overlap}),
+        matches.rename(columns={col: f"{col}_y" for col in overlap}),
+    ], axis=1)
 
     # Remove matching records
+    needs_df_filtered = needs_df[~is_hit]
+
+    return hits_df, needs_df_filtered
+
+
+# Function to split normalized needs rows into hits and remaining rows in one pass
+def match_addresses(needs_df, allskipped_df, scrub_on, key_index=None, load_rows=None):
+    with track_stage('match', len(needs_df)):
+        key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+        matched_rows = find_matching_rows(needs_df, allskipped_df, key_columns, key_index)
+        return split_hits(needs_df, allskipped_df, key_columns, matched_rows, load_rows)
+
+
+# Fuzzy matching: needs rows without an exact match are compared only with the skip traced rows
+# in the same block (house number plus the first letters of the street name, after any
+# directional), scored with Levenshtein.ratio on 0-100 and matched at or above a threshold.
+# A block with more than fuzzy_max_block_rows skip traced rows is narrowed to a longer street
+# prefix, level by level; only at the last level are its extra rows left out, and counted as
+# 'fuzzy_dropped_candidates' in the stage metrics.
+fuzzy_max_block_rows = int(os.getenv("FUZZY_MAX_BLOCK_ROWS", "50"))
+fuzzy_block_pattern = r'^(\d[\w-]*)\s+(?:(?:n|s|e|w|ne|nw|se|sw)\s+)?(\w[\w ]*)'
+FUZZY_BLOCK_PREFIX_LENGTHS = [3, 8, 16]
+
+
+# Function to split normalized addresses into the house number and street text that blocking
+# keys are cut from (NaN without a house number)
+def address_block_parts(addresses):
+    parts = addresses.astype(object).str.extract(fuzzy_block_pattern)
+    return pd.DataFrame({'number': parts[0].to_numpy(), 'street': parts[1].str.rstrip().to_numpy()})
+
+
+# Function to compute the blocking keys of address parts at one street prefix length
+def address_blocks(parts, prefix_length):
+    return parts['number'] + ' ' + parts['street'].str[:prefix_length]
+
+
+# Function to split the skip traced addresses into blocking parts once, for reuse across the
+# chunks or files scrubbed against them
+def build_fuzzy_block_index(allskipped_df, key_columns):
+    block_column = 'property_address' if 'property_address' in key_columns else key_columns[0]
+    parts = address_block_parts(allskipped_df[block_column]).dropna()
+    return {'parts': parts, 'blocks': address_blocks(parts, FUZZY_BLOCK_PREFIX_LENGTHS[0])}
+
+
+# Function to pair needs rows with the skip traced rows of their block, narrowing blocks that
+# are over fuzzy_max_block_rows. Returns a frame of (needs_row, skip_row) pairs.
+def fuzzy_candidate_pairs(needs_parts, block_index):
+    needs_parts = needs_parts.dropna()
+    skip_parts = block_index['parts']
+    pairs, dropped = [], 0
+    for level, prefix_length in enumerate(FUZZY_BLOCK_PREFIX_LENGTHS):
+        skip_blocks = pd.DataFrame({
+            'block': block_index['blocks'] if level == 0 else address_blocks(skip_parts, prefix_length),
+            'skip_row': skip_parts.index,
+        })
+        needs_blocks = pd.DataFrame({'block': address_blocks(needs_parts, prefix_length), 'needs_row': needs_parts.index})
+        block_sizes = skip_blocks['block'].value_counts()
+        is_oversized = needs_blocks['block'].map(block_sizes).fillna(0).to_numpy() > fuzzy_max_block_rows
+        if level == len(FUZZY_BLOCK_PREFIX_LENGTHS) - 1:
+            oversized_blocks = needs_blocks['block'][is_oversized].unique()
+            dropped += int((block_sizes[oversized_blocks] - fuzzy_max_block_rows).sum())
+            skip_blocks = skip_blocks.groupby('block', sort=False).head(fuzzy_max_block_rows)
+            pairs.append(needs_blocks.merge(skip_blocks, on='block'))
+            break
+        pairs.append(needs_blocks[~is_oversized].merge(skip_blocks, on='block'))
+        if not is_oversized.any():
+            break
+        # Only the rows of oversized blocks go on to the next, longer prefix
+        oversized_blocks = needs_blocks['block'][is_oversized].unique()
+        needs_parts = needs_parts[is_oversized]
+        skip_parts = skip_parts[skip_blocks['block'].isin(oversized_blocks).to_numpy()]
+
+    if dropped:
+        logger.warning("Fuzzy matching left out %d skip traced candidates of blocks over %d rows", dropped, fuzzy_max_block_rows)
+    count_stage_rows('fuzzy_dropped_candidates', dropped)
+    return pd.concat(pairs, ignore_index=True)[['needs_row', 'skip_row']]
+
+
+# Function to score address pairs; unmapped (null) keys never match
+def address_similarity(first, second):
+    return np.array([
+        Levenshtein.ratio(a, b) * 100 if isinstance(a, str) and isinstance(b, str) else 0.0
+        for a, b in zip(first, second)
+    ])
+
+
+# Function to find, for each needs row, the best scoring skip traced row of its block at or
+# above the threshold, for the needs rows listed in rows. Returns (matched rows, scores).
+# Pass block_index when it is already built.
+def find_fuzzy_matching_rows(needs_df, allskipped_df, key_columns, threshold, rows, block_index=None):
+    block_column = 'property_address' if 'property_address' in key_columns else key_columns[0]
+    block_index = block_index if block_index is not None else build_fuzzy_block_index(allskipped_df, key_columns)
+    needs_parts = address_block_parts(needs_df[block_column].iloc[rows])
+    needs_parts.index = rows
+    pairs = fuzzy_candidate_pairs(needs_parts, block_index)
+
+    scores = np.full(len(pairs), 100.0)
+    for column in key_columns:
+        scores = np.minimum(scores, address_similarity(
+            needs_df[column].to_numpy()[pairs['needs_row']], allskipped_df[column].iloc[pairs['skip_row'].to_numpy()].to_numpy()
+        ))
+    pairs['score'] = scores
+    best = pairs[pairs['score'] >= threshold].sort_values(['needs_row', 'score', 'skip_row'], ascending=[True, False, True], kind='stable')
+    best = best.drop_duplicates('needs_row')
+
+    matched_rows = np.full(len(needs_df), -1, dtype=np.int64)
+    match_scores = np.full(len(needs_df), np.nan)
+    matched_rows[best['needs_row'].to_numpy()] = best['skip_row'].to_numpy()
+    match_scores[best['needs_row'].to_numpy()] = best['score'].to_numpy()
+    return matched_rows, match_scores
+
+
+# Function to split normalized needs rows into hits and remaining rows, accepting near matches.
+# Exact matches score 100; hits_df gets a match_score column. Pass key_index and block_index
+# when they are already built.
+def fuzzy_match_addresses(needs_df, allskipped_df, scrub_on, threshold, load_rows=None, key_index=None, block_index=None):
+    with track_stage('match', len(needs_df)):
+        key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+        matched_rows = find_matching_rows(needs_df, allskipped_df, key_columns, key_index)
+        match_scores = np.where(matched_rows >= 0, 100.0, np.nan)
+        unmatched = np.flatnonzero(matched_rows < 0)
+        fuzzy_rows, fuzzy_scores = find_fuzzy_matching_rows(needs_df, allskipped_df, key_columns, threshold, unmatched,
+                                                            block_index)
+        is_fuzzy = fuzzy_rows >= 0
+        matched_rows[is_fuzzy] = fuzzy_rows[is_fuzzy]
+        match_scores[is_fuzzy] = fuzzy_scores[is_fuzzy]
+
+        hits_df, needs_df_filtered = split_hits(needs_df, allskipped_df, key_columns, matched_rows, load_rows)
+        hits_df['match_score'] = match_scores[matched_rows >= 0].round(1)
+        return hits_df, needs_df_filtered
+
+
+# Function to test which key hashes are present in a sorted fingerprint array
+def contains_fingerprints(fingerprints, hashes):
+    if len(fingerprints) == 0:
+        return np.zeros(len(hashes), dtype=bool)
+    slots = np.searchsorted(fingerprints, hashes).clip(max=len(fingerprints) - 1)
+    return fingerprints[slots] == hashes
+
+
+# Function to split normalized needs rows using only the skip traced key fingerprints.
+# About 8 bytes per key; a 64-bit hash collision could in principle report a false hit.
+def match_fingerprints(needs_df, fingerprints, scrub_on):
+    with track_stage('match', len(needs_df)):
+        is_hit = contains_fingerprints(fingerprints, hash_address_keys(needs_df, SCRUB_KEY_COLUMNS[scrub_on]))
+        return needs_df[is_hit].reset_index(drop=True), needs_df[~is_hit]
+
+
+# Function to normalize the address columns used by the selected condition
+def normalize_key_columns(df, scrub_on):
+    for column in SCRUB_KEY_COLUMNS[scrub_on]:
+        df[column] = normalize_address_series(df[column])
+    return df
+
+
+# Function to check that the columns the scrubbing condition needs are mapped in both files
+def check_column_mapping(scrub_on, combined_property_col, combined_mailing_col, needs_property_col, needs_mailing_col):
     if scrub_on == 'Both':
-        needs_df_filtered = needs_df[
-            ~needs_df[['mailing_address', 'property_address']].apply(tuple, axis=1).isin(
-                hits_df[['mailing_address', 'property_address']].apply(tuple, axis=1)
+        if combined_property_col == 'None' or combined_mailing_col == 'None' or needs_property_col == 'None' or needs_mailing_col == 'None':
+            return "Please map both Property Address and Mailing Address columns for both datasets."
+    elif scrub_on =='Property Address':
+        if combined_property_col == 'None' or needs_property_col == 'None':
+            return "Please map both Property Address for both datasets."
+    elif scrub_on =='Mailing Address':
+        if combined_mailing_col == 'None' or needs_mailing_col == 'None':
+            return "Please map both Mailing Address for both datasets."
+    return None
+
+
+# Function to perform scrubbing logic
+# With fuzzy_threshold (0-100), near matches count as hits too, see fuzzy_match_addresses.
+def scrub_data(needs_df, allskipped_df, scrub_on, load_rows=None, fuzzy_threshold=None):
+    normalize_key_columns(allskipped_df, scrub_on)
+    normalize_key_columns(needs_df, scrub_on)
+
+    if fuzzy_threshold is not None:
+        return fuzzy_match_addresses(needs_df, allskipped_df, scrub_on, fuzzy_threshold, load_rows)
+    return match_addresses(needs_df, allskipped_df, scrub_on, load_rows=load_rows)
+
+
+# Function to title case the standardized address columns for the downloadable files
+def title_case_address_columns(df):
+    for column in ['property_address', 'mailing_address']:
+        if column in df.columns:
+            df[column] = df[column].str.title()
+    return df
+
+
+# Download formats: each result is serialized once, in the chosen format only, into a file
+# that is read for download on request. 'zip' bundles both results as CSV files.
+EXPORT_FORMATS = {
+    'CSV (gzip)': 'csv.gz',
+    'Parquet': 'parquet',
+    'Zip bundle of both CSV files': 'zip',
+    'CSV': 'csv',
+}
+EXPORT_MIME_TYPES = {
+    'csv.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+    'zip': 'application/zip',
+    'csv': 'text/csv',
+}
+
+
+# Function to write a whole result frame, with title cased addresses, to a file
+def write_result_file(df, path, file_format):
+    # A shallow copy gets the title cased columns without copying the rest of the frame
+    df = title_case_address_columns(df.copy(deep=False))
+    if file_format == 'parquet':
+        pq.write_table(parquet_table(df), path)
+    else:
+        df.to_csv(path, index=False, compression='gzip' if file_format == 'csv.gz' else None)
+
+
+# Function to convert a frame to an Arrow table, optionally with a given schema
+def parquet_table(df, schema=None):
+    try:
+        return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Columns mixing numbers and text are written as text
+        object_columns = df.select_dtypes(include='object').columns
+        return pa.Table.from_pandas(df.astype({col: 'string' for col in object_columns}), schema=schema, preserve_index=False)
+
+
+# Function to append a chunk of results to a file. writers tracks the files already started
+# (and their Parquet writers); pass it to close_result_writers when done.
+# The first chunk sets the Parquet schema; columns with no values in it are strings.
+def append_result_chunk(df, path, file_format, writers):
+    df = title_case_address_columns(df.copy(deep=False))
+    if file_format == 'parquet':
+        if path not in writers:
+            schema = parquet_table(df).schema
+            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema],
+                               metadata=schema.metadata)
+            writers[path] = pq.ParquetWriter(path, schema)
+        writers[path].write_table(parquet_table(df, writers[path].schema))
+        return
+    # Appended gzip members form one valid gzip file
+    df.to_csv(path, mode='a' if path in writers else 'w', header=path not in writers, index=False,
+              compression='gzip' if file_format == 'csv.gz' else None)
+    writers[path] = None
+
+
+def close_result_writers(writers):
+    for writer in writers.values():
+        if writer is not None:
+            writer.close()
+
+
+# Function to list the finished result files to download; the 'zip' format bundles both
+# result files into Scrub_results.zip and removes the originals
+def finish_result_files(hits_path, filtered_path, file_format):
+    if file_format != 'zip':
+        return [hits_path, filtered_path]
+    return bundle_result_files([hits_path, filtered_path], os.path.dirname(hits_path))
+
+
+# Function to bundle result files into output_dir/Scrub_results.zip, removing the originals
+def bundle_result_files(paths, output_dir):
+    bundle_path = os.path.join(output_dir, 'Scrub_results.zip')
+    with zipfile.ZipFile(bundle_path, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        for path in paths:
+            bundle.write(path, arcname=os.path.basename(path))
+            os.remove(path)
+    return [bundle_path]
+
+
+# Function to name the result files of a format: (hits path, filtered path) inside output_dir
+def result_paths(output_dir, file_format):
+    extension = 'csv' if file_format == 'zip' else file_format
+    return os.path.join(output_dir, f'Hits.{extension}'), os.path.join(output_dir, f'Filtered_file.{extension}')
+
+
+# Function to write in-memory results once, in the chosen format; returns the files to download
+def export_results(hits_df, needs_df_filtered, file_format, output_dir=None):
+    output_dir = output_dir or tempfile.mkdtemp(prefix='scrub_')
+    hits_path, filtered_path = result_paths(output_dir, file_format)
+    with track_stage('export', len(hits_df) + len(needs_df_filtered)):
+        write_result_file(hits_df, hits_path, 'csv' if file_format == 'zip' else file_format)
+        write_result_file(needs_df_filtered, filtered_path, 'csv' if file_format == 'zip' else file_format)
+        return finish_result_files(hits_path, filtered_path, file_format)
+
+
+# Function to offer result files as downloads. download_button holds the whole file in memory,
+# so a file is only read after its Prepare button is pressed, and is let go once downloaded.
+def show_result_downloads(paths):
+    for path in paths:
+        file_name = os.path.basename(path)
+        file_format = file_name.split('.', 1)[1]
+        prepared_key = f"download_prepared_{path}"
+        size_mb = os.path.getsize(path) / (1 << 20)
+        if st.session_state.get(prepared_key) or st.button(f"Prepare {file_name} for download ({size_mb:.1f} MB)",
+                                                             key=f"prepare_{path}"):
+            st.session_state[prepared_key] = True
+            with open(path, 'rb') as result_file:
+                st.download_button(label=f"Download {file_name}", data=result_file.read(), file_name=file_name,
+                                   mime=EXPORT_MIME_TYPES[file_format], key=f"download_{path}",
+                                   on_click=st.session_state.pop, args=(prepared_key, None))
+
+
+# Previews read one page of rows from disk at a time and send only that page to the browser.
+# Results are paged from a Parquet copy with small row groups; uploads are paged from the
+# uploaded file, and only their first preview_sample_rows rows are kept for the column mapping.
+preview_page_rows = int(os.getenv("PREVIEW_PAGE_ROWS", "100"))
+preview_row_group_rows = int(os.getenv("PREVIEW_ROW_GROUP_ROWS", "10000"))
+preview_sample_rows = int(os.getenv("PREVIEW_SAMPLE_ROWS", "1000"))
+
+
+# Function to show the row count and one page of rows, with a page selector.
+# read_page(start, rows) reads the rows from start on.
+def show_paginated_preview(label, total_rows, read_page, key):
+    pages = max(1, -(-total_rows // preview_page_rows))
+    st.write(f"{label}: {total_rows} rows")
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key) if pages > 1 else 1
+    st.dataframe(read_page((page - 1) * preview_page_rows, preview_page_rows))
+
+
+# Function to copy a result file (CSV, gzipped CSV or Parquet) to a Parquet file with row groups
+# of at most preview_row_group_rows, so a page is read without reading the rest of the file
+def write_page_file(path, page_path):
+    if path.endswith('.parquet'):
+        source = pq.ParquetFile(path)
+        schema, batches = source.schema_arrow, source.iter_batches(batch_size=preview_row_group_rows)
+    else:
+        source = pacsv.open_csv(path, convert_options=csv_convert_options(path))
+        schema, batches = source.schema, source
+    with pq.ParquetWriter(page_path, schema) as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_batches([batch], schema=schema), row_group_size=preview_row_group_rows)
+
+
+# Function to read rows start to start + rows of a Parquet file, reading only the row groups they are in
+def read_parquet_page(path, start, rows):
+    parquet_file = pq.ParquetFile(path)
+    groups, first_row, offset = [], None, 0
+    for group in range(parquet_file.metadata.num_row_groups):
+        group_rows = parquet_file.metadata.row_group(group).num_rows
+        if offset + group_rows > start and offset < start + rows:
+            first_row = offset if first_row is None else first_row
+            groups.append(group)
+        offset += group_rows
+    if not groups:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return parquet_file.read_row_groups(groups).slice(start - first_row, rows).to_pandas()
+
+
+# Function to count the rows of an uploaded CSV file, parsing only its first column
+@st.cache_data(max_entries=32, show_spinner=False)
+def count_csv_rows(file_key, _file):
+    _file.seek(0)
+    first_column = read_csv_columns(_file)[:1]
+    with pacsv.open_csv(_file, convert_options=csv_convert_options(_file, first_column)) as reader:
+        rows = sum(batch.num_rows for batch in reader)
+    _file.seek(0)
+    return rows
+
+
+# Function to read rows start to start + rows of uploaded CSV files, taken as one table
+def read_uploads_page(files, start, rows):
+    pages = []
+    for file in files:
+        file_rows = count_csv_rows(upload_key(file), file)
+        if start < file_rows and rows > 0:
+            file.seek(0)
+            pages.append(pd.read_csv(file, skiprows=range(1, start + 1), nrows=min(rows, file_rows - start)))
+            file.seek(0)
+            rows -= len(pages[-1])
+        start = max(0, start - file_rows)
+    return pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
+
+
+# Function to show a paged preview of uploaded CSV files
+def show_uploads_preview(label, files, key):
+    total_rows = sum(count_csv_rows(upload_key(file), file) for file in files)
+    show_paginated_preview(label, total_rows, lambda start, rows: read_uploads_page(files, start, rows), key)
+
+
+# Function to show a paged preview of a Parquet page file
+def show_page_file_preview(label, path, key):
+    show_paginated_preview(label, pq.ParquetFile(path).metadata.num_rows,
+                           lambda start, rows: read_parquet_page(path, start, rows), key)
+
+
+# Rows read per chunk when streaming a file to scrub
+scrub_chunk_rows = int(os.getenv("SCRUB_CHUNK_ROWS", "500000"))
+
+
+# Function to match normalized needs rows against whichever suppression data is given; see
+# scrub_chunks for the arguments
+def match_normalized(needs_df, allskipped_df, scrub_on, fingerprints=None, use_store=False, fuzzy_threshold=None,
+                     key_index=None, fuzzy_block_index=None):
+    if use_store:
+        return match_against_store(needs_df, scrub_on)
+    if fingerprints is not None:
+        return match_fingerprints(needs_df, fingerprints, scrub_on)
+    if fuzzy_threshold is not None:
+        return fuzzy_match_addresses(needs_df, allskipped_df, scrub_on, fuzzy_threshold, key_index=key_index,
+                                     block_index=fuzzy_block_index)
+    return match_addresses(needs_df, allskipped_df, scrub_on, key_index)
+
+
+# Function to build the lookup structures of the skip traced rows that are not given yet, once
+# for all the chunks or files matched against them; returns (key_index, fuzzy_block_index)
+def build_match_indexes(allskipped_df, scrub_on, fingerprints=None, use_store=False, fuzzy_threshold=None,
+                        key_index=None, fuzzy_block_index=None):
+    if fingerprints is not None or use_store:
+        return key_index, fuzzy_block_index
+    key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+    if key_index is None:
+        key_index = build_key_index(allskipped_df, key_columns)
+    if fuzzy_threshold is not None and fuzzy_block_index is None:
+        fuzzy_block_index = build_fuzzy_block_index(allskipped_df, key_columns)
+    return key_index, fuzzy_block_index
+
+
+# Function to scrub chunks of a file against normalized skip traced keys, writing the hits and
+# filtered rows to files in file_format as it goes. Returns (hits path, filtered path, hits, rows);
+# for the 'zip' format these are the CSV files, to pass to finish_result_files.
+# Pass fingerprints instead of allskipped_df to match against a fingerprint set, or use_store
+# to match against the database-backed suppression store. progress(counter, rows) is called
+# as each chunk is normalized ('rows_normalized') and matched ('rows_matched'); setting the
+# cancel event stops before the next chunk. Pass key_index and fuzzy_block_index when they are
+# already built.
+def scrub_chunks(needs_chunks, allskipped_df, scrub_on, needs_property_col, needs_mailing_col, output_dir=None,
+                 fingerprints=None, use_store=False, file_format='csv', fuzzy_threshold=None, progress=None, cancel=None,
+                 key_index=None, fuzzy_block_index=None):
+    output_dir = output_dir or tempfile.mkdtemp(prefix='scrub_')
+    hits_path, filtered_path = result_paths(output_dir, file_format)
+    chunk_format = 'csv' if file_format == 'zip' else file_format
+    writers = {}
+    key_index, fuzzy_block_index = build_match_indexes(allskipped_df, scrub_on, fingerprints, use_store, fuzzy_threshold,
+                                                       key_index, fuzzy_block_index)
+    hit_count = row_count = 0
+
+    for needs_chunk in needs_chunks:
+        if cancel is not None and cancel.is_set():
+            break
+        needs_chunk = needs_chunk.rename(columns={
+            needs_property_col: 'property_address',
+            needs_mailing_col: 'mailing_address'
+        })
+        normalize_key_columns(needs_chunk, scrub_on)
+        if progress is not None:
+            progress('rows_normalized', len(needs_chunk))
+        hits_chunk, filtered_chunk = match_normalized(needs_chunk, allskipped_df, scrub_on, fingerprints, use_store,
+                                                      fuzzy_threshold, key_index, fuzzy_block_index)
+        with track_stage('export', len(needs_chunk)):
+            append_result_chunk(hits_chunk, hits_path, chunk_format, writers)
+            append_result_chunk(filtered_chunk, filtered_path, chunk_format, writers)
+        hit_count += len(hits_chunk)
+        row_count += len(needs_chunk)
+        if progress is not None:
+            progress('rows_matched', len(needs_chunk))
+    close_result_writers(writers)
+
+    return hits_path, filtered_path, hit_count, row_count
+
+
+# Function to scrub a CSV file read chunk by chunk; see scrub_chunks for the arguments
+def scrub_file_in_chunks(file_to_scrub, allskipped_df, scrub_on, needs_property_col, needs_mailing_col,
+                         chunk_rows=scrub_chunk_rows, **kwargs):
+    # dtype=str keeps each value as written, since types inferred per chunk can disagree
+    chunks = pd.read_csv(file_to_scrub, chunksize=chunk_rows, dtype=str)
+    return scrub_chunks(track_chunks(chunks), allskipped_df, scrub_on, needs_property_col, needs_mailing_col, **kwargs)
+
+
+# Function to normalize the key columns of several frames together, so an address shared
+# between them is normalized once
+def normalize_batch_key_columns(frames, scrub_on):
+    offsets = np.cumsum([0] + [len(df) for df in frames])
+    for column in SCRUB_KEY_COLUMNS[scrub_on]:
+        normalized = normalize_address_series(pd.concat([df[column] for df in frames], ignore_index=True)).to_numpy()
+        for df, start, end in zip(frames, offsets[:-1], offsets[1:]):
+            df[column] = normalized[start:end]
+    return frames
+
+
+# Function to name a batch target's result files after its file name, made unique within the batch
+def batch_result_prefix(name, used_prefixes):
+    prefix = re.sub(r'[^A-Za-z0-9_-]+', '_', os.path.splitext(os.path.basename(name))[0]).strip('_') or 'target'
+    unique_prefix, copy = prefix, 1
+    while unique_prefix in used_prefixes:
+        copy += 1
+        unique_prefix = f"{prefix}_{copy}"
+    used_prefixes.add(unique_prefix)
+    return unique_prefix
+
+
+# Function to scrub several files against one set of suppression data in a single pass.
+# targets lists (name, file, property column, mailing column) per file; the other arguments are
+# those of scrub_chunks. Every target gets <name>_Hits and <name>_Filtered_file result files,
+# and Batch_summary.csv has the hit counts of each. Returns (result files, summary rows); the
+# 'zip' format bundles all of them into Scrub_results.zip.
+def scrub_batch(targets, allskipped_df, scrub_on, output_dir=None, fingerprints=None, use_store=False,
+                file_format='csv', fuzzy_threshold=None, progress=None, cancel=None, key_index=None,
+                fuzzy_block_index=None):
+    output_dir = output_dir or tempfile.mkdtemp(prefix='scrub_')
+    result_format = 'csv' if file_format == 'zip' else file_format
+    key_index, fuzzy_block_index = build_match_indexes(allskipped_df, scrub_on, fingerprints, use_store, fuzzy_threshold,
+                                                       key_index, fuzzy_block_index)
+
+    needs_frames = []
+    for name, file, needs_property_col, needs_mailing_col in targets:
+        with track_stage('csv_load') as record:
+            needs_frames.append(pd.read_csv(file).rename(columns={
+                needs_property_col: 'property_address',
+                needs_mailing_col: 'mailing_address'
+            }))
+            record['rows'] = len(needs_frames[-1])
+    normalize_batch_key_columns(needs_frames, scrub_on)
+    if progress is not None:
+        progress('rows_normalized', sum(len(df) for df in needs_frames))
+
+    paths, summary, used_prefixes = [], [], set()
+    for (name, *_), needs_df in zip(targets, needs_frames):
+        if cancel is not None and cancel.is_set():
+            break
+        hits_df, needs_df_filtered = match_normalized(needs_df, allskipped_df, scrub_on, fingerprints, use_store,
+                                                      fuzzy_threshold, key_index, fuzzy_block_index)
+        prefix = batch_result_prefix(name, used_prefixes)
+        with track_stage('export', len(needs_df)):
+            for suffix, df in [('Hits', hits_df), ('Filtered_file', needs_df_filtered)]:
+                paths.append(os.path.join(output_dir, f"{prefix}_{suffix}.{result_format}"))
+                write_result_file(df, paths[-1], result_format)
+        summary.append({'target': name, 'rows': len(needs_df), 'hits': len(hits_df), 'remaining': len(needs_df_filtered)})
+        if progress is not None:
+            progress('rows_matched', len(needs_df))
+
+    paths.append(os.path.join(output_dir, 'Batch_summary.csv'))
+    pd.DataFrame(summary, columns=['target', 'rows', 'hits', 'remaining']).to_csv(paths[-1], index=False)
+    if file_format == 'zip':
+        paths = bundle_result_files(paths, output_dir)
+    return paths, summary
+
+
+# Persistent suppression index: normalized keys of every skip traced file ingested so far.
+# Each file is stored once as a Parquet part named by its content hash, next to a JSON manifest.
+# Changes to the manifest and the parts are made under its file lock, so sessions and processes
+# ingesting at the same time do not lose each other's parts.
+suppression_index_dir = os.getenv("SUPPRESSION_INDEX_DIR", "suppression_index")
+suppression_manifest_lock = threading.Lock()
+
+
+# Function to hash a file path or uploaded file without keeping a second copy in memory
+def file_content_hash(file):
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as source:
+            for block in iter(lambda: source.read(1 << 20), b''):
+                digest.update(block)
+    else:
+        file.seek(0)
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def load_suppression_manifest(index_dir):
+    try:
+        with open(os.path.join(index_dir, 'manifest.json')) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {'rules_version': rules_version, 'files': {}}
+
+
+def suppression_manifest_file_lock(index_dir):
+    os.makedirs(index_dir, exist_ok=True)
+    return exclusive_file_lock(os.path.join(index_dir, 'manifest.json'), suppression_manifest_lock)
+
+
+def save_suppression_manifest(index_dir, manifest):
+    manifest_path = os.path.join(index_dir, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+# Function to normalize the raw address columns of an index part
+def normalize_index_part(part):
+    for column in ['property_address', 'mailing_address']:
+        # Unmapped columns stay null so they never match; empty cells match like in scrub_data
+        part[column] = normalize_address_series(part['raw_' + column]).where(part['has_' + column], None)
+    return part
+
+
+# Function to read the mapped address columns of a skip traced file into a normalized index part
+def build_index_part(file, property_col, mailing_col):
+    # The mapping comes from the combined upload, so a single file may lack a mapped column
+    columns = {'property_address': property_col, 'mailing_address': mailing_col}
+    df = pd.read_csv(file, usecols=lambda col: col in columns.values(), dtype=str)
+    part = pd.DataFrame(index=df.index)
+    for column, source_col in columns.items():
+        part['raw_' + column] = df[source_col] if source_col in df.columns else None
+        part['has_' + column] = source_col in df.columns
+    return normalize_index_part(part.drop_duplicates()).reset_index(drop=True)
+
+
+# Function to add a skip traced file to the suppression index; returns False if it was already there
+def ingest_suppression_file(file, property_col, mailing_col, index_dir=suppression_index_dir):
+    digest = file_content_hash(file)
+    if digest in load_suppression_manifest(index_dir)['files']:
+        return False
+
+    # The part is normalized outside the lock; the manifest is read again under it
+    part = build_index_part(file, property_col, mailing_col)
+    with suppression_manifest_file_lock(index_dir):
+        manifest = load_suppression_manifest(index_dir)
+        if digest in manifest['files']:
+            return False
+        if manifest['rules_version'] != rules_version:
+            rebuild_suppression_index(index_dir, manifest)
+        part.to_parquet(os.path.join(index_dir, f"{digest}.parquet"), index=False)
+        manifest['files'][digest] = {
+            'name': getattr(file, 'name', str(file)),
+            'rows': len(part),
+            'property_column': property_col,
+            'mailing_column': mailing_col,
+            'ingested_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        save_suppression_manifest(index_dir, manifest)
+    return True
+
+
+# Function to re-normalize the parts if the rule tables changed since they were written;
+# returns the manifest they are current with
+def refresh_suppression_index(index_dir, manifest):
+    if not manifest['files'] or manifest['rules_version'] == rules_version:
+        return manifest
+    with suppression_manifest_file_lock(index_dir):
+        manifest = load_suppression_manifest(index_dir)
+        if manifest['rules_version'] != rules_version:
+            rebuild_suppression_index(index_dir, manifest)
+    return manifest
+
+
+# Function to re-normalize every part after the rule tables change; call it holding the manifest lock
+def rebuild_suppression_index(index_dir, manifest):
+    for digest in manifest['files']:
+        part_path = os.path.join(index_dir, f"{digest}.parquet")
+        normalize_index_part(pd.read_parquet(part_path)).to_parquet(part_path, index=False)
+    manifest['rules_version'] = rules_version
+    save_suppression_manifest(index_dir, manifest)
+
+
+# Function to name the state of the index keys for a scrubbing condition: the files in it, the
+# rules they were normalized with and the scheme their fingerprints are hashed with
+def suppression_index_state(manifest, key_columns):
+    return hashlib.sha256(json.dumps([rules_version, address_key_hash_scheme, key_columns,
+                                      sorted(manifest['files'])]).encode()).hexdigest()[:16]
+
+
+# Function to load the distinct normalized keys for a scrubbing condition
+def load_suppression_index(scrub_on, index_dir=suppression_index_dir):
+    key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+    manifest = refresh_suppression_index(index_dir, load_suppression_manifest(index_dir))
+    parts = [
+        pd.read_parquet(os.path.join(index_dir, f"{digest}.parquet"), columns=key_columns)
+        for digest in manifest['files']
+    ]
+    if not parts:
+        return pd.DataFrame(columns=key_columns)
+    return pd.concat(parts, ignore_index=True).dropna(subset=key_columns).drop_duplicates()
+
+
+# Function to load the sorted fingerprints of the index keys for a scrubbing condition.
+# They are saved next to the parts as a .npy file named after the index state and memory-mapped.
+def load_suppression_fingerprints(scrub_on, index_dir=suppression_index_dir):
+    key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+    manifest = refresh_suppression_index(index_dir, load_suppression_manifest(index_dir))
+    if not manifest['files']:
+        return np.array([], dtype=np.uint64)
+
+    key_name = '-'.join(key_columns)
+    state = suppression_index_state(manifest, key_columns)
+    fingerprints_path = os.path.join(index_dir, f"fingerprints-{key_name}-{state}.npy")
+    if not os.path.exists(fingerprints_path):
+        # Hash one part at a time so the address strings are never all in memory together
+        hashes = []
+        for digest in manifest['files']:
+            part = pd.read_parquet(os.path.join(index_dir, f"{digest}.parquet"), columns=key_columns)
+            hashes.append(hash_address_keys(part.dropna(subset=key_columns), key_columns))
+        for stale_path in glob.glob(os.path.join(index_dir, f"fingerprints-{key_name}-*.npy")):
+            os.remove(stale_path)
+        temp_path = fingerprints_path[:-len('.npy')] + '.tmp.npy'
+        np.save(temp_path, np.unique(np.concatenate(hashes)))
+        os.replace(temp_path, fingerprints_path)
+    return np.load(fingerprints_path, mmap_mode='r')
+
+
+# Function to scrub against the saved suppression index instead of uploaded files
+# Fuzzy matching compares address text, so it always loads the keys instead of fingerprints.
+def scrub_against_index(needs_df, scrub_on, index_dir=suppression_index_dir, use_fingerprints=True,
+                        fuzzy_threshold=None):
+    normalize_key_columns(needs_df, scrub_on)
+    use_fingerprints = use_fingerprints and fuzzy_threshold is None
+
+    with track_stage('index_load'):
+        suppression = load_suppression_fingerprints(scrub_on, index_dir) if use_fingerprints else load_suppression_index(scrub_on, index_dir)
+    if use_fingerprints:
+        return match_fingerprints(needs_df, suppression, scrub_on)
+    if fuzzy_threshold is not None:
+        return fuzzy_match_addresses(needs_df, suppression, scrub_on, fuzzy_threshold)
+    return match_addresses(needs_df, suppression, scrub_on)
+
+
+# Optional database-backed suppression store (SUPPRESSION_STORE=postgres or sqlite), used instead
+# of the index files. Keys live in an indexed table, and scrubs push the target's keys to a temp
+# table and let the database find the hits, so the app never loads the suppression history.
+# SQLite is a local stand-in with the same tables and queries.
+suppression_store = os.getenv("SUPPRESSION_STORE", "files")
+suppression_sqlite_path = os.getenv("SUPPRESSION_SQLITE_PATH", "suppression.sqlite3")
+suppression_fetch_rows = 100000
+
+SUPPRESSION_STORE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS suppression_files (
+        source_hash TEXT PRIMARY KEY, name TEXT, rows INTEGER,
+        property_column TEXT, mailing_column TEXT, ingested_at TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS suppression_keys (
+        source_hash TEXT, raw_property_address TEXT, raw_mailing_address TEXT,
+        has_property_address SMALLINT, has_mailing_address SMALLINT,
+        property_address TEXT, mailing_address TEXT
+    )""",
+    # Property-only lookups use the leading column of the first index
+    "CREATE INDEX IF NOT EXISTS suppression_keys_both ON suppression_keys (property_address, mailing_address)",
+    "CREATE INDEX IF NOT EXISTS suppression_keys_mailing ON suppression_keys (mailing_address)",
+    "CREATE INDEX IF NOT EXISTS suppression_keys_source ON suppression_keys (source_hash)",
+    "CREATE TABLE IF NOT EXISTS suppression_meta (name TEXT PRIMARY KEY, value TEXT)",
+]
+
+
+# Context manager opening the configured store; changes are committed when the block succeeds
+@contextmanager
+def suppression_store_connection():
+    if suppression_store == 'postgres':
+        with postgres_connection() as conn:
+            if conn is None:
+                raise ConnectionError("The Postgres suppression store is unavailable")
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    else:
+        conn = sqlite3.connect(suppression_sqlite_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+# Function to run a statement with %s placeholders on either store
+def execute_store_query(conn, query, params=()):
+    cur = conn.cursor()
+    if isinstance(conn, sqlite3.Connection):
+        query = query.replace('%s', '?')
+    cur.execute(query, params)
+    return cur
+
+
+# Function to bulk load a frame into a table: COPY on Postgres, one executemany on SQLite
+def bulk_load_frame(conn, table, df):
+    columns = ', '.join(df.columns)
+    if isinstance(conn, sqlite3.Connection):
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({', '.join('?' * len(df.columns))})", rows)
+        return
+    # \N marks nulls, so empty addresses stay empty strings
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    cur = conn.cursor()
+    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+    cur.close()
+
+
+# Function to write a normalized index part into the keys table
+def load_store_part(conn, digest, part):
+    part = part.assign(source_hash=digest)
+    for column in ['has_property_address', 'has_mailing_address']:
+        part[column] = part[column].astype(int)
+    bulk_load_frame(conn, 'suppression_keys', part[[
+        'source_hash', 'raw_property_address', 'raw_mailing_address', 'has_property_address',
+        'has_mailing_address', 'property_address', 'mailing_address'
+    ]])
+
+
+# Function to create the store tables and re-normalize the stored keys after a rule change
+def prepare_suppression_store(conn):
+    for statement in SUPPRESSION_STORE_TABLES:
+        execute_store_query(conn, statement).close()
+    stored = execute_store_query(conn, "SELECT value FROM suppression_meta WHERE name = 'rules_version'").fetchone()
+    if stored is not None and stored[0] == rules_version:
+        return
+    digests = [row[0] for row in execute_store_query(conn, "SELECT source_hash FROM suppression_files").fetchall()]
+    for digest in digests:
+        cur = execute_store_query(conn, """
+            SELECT raw_property_address, raw_mailing_address, has_property_address, has_mailing_address
+            FROM suppression_keys WHERE source_hash = %s
+        """, (digest,))
+        part = pd.DataFrame(cur.fetchall(), columns=[column[0] for column in cur.description])
+        for column in ['has_property_address', 'has_mailing_address']:
+            part[column] = part[column].astype(bool)
+        execute_store_query(conn, "DELETE FROM suppression_keys WHERE source_hash = %s", (digest,)).close()
+        load_store_part(conn, digest, normalize_index_part(part))
+    execute_store_query(conn, """
+        INSERT INTO suppression_meta (name, value) VALUES ('rules_version', %s)
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value
+    """, (rules_version,)).close()
+
+
+# Function to count the files and addresses in the store
+def suppression_store_summary():
+    with suppression_store_connection() as conn:
+        prepare_suppression_store(conn)
+        files, rows = execute_store_query(conn, "SELECT count(*), coalesce(sum(rows), 0) FROM suppression_files").fetchone()
+    return files, int(rows)
+
+
+# Function to add a skip traced file to the store; returns False if it was already there
+def store_suppression_file(file, property_col, mailing_col):
+    digest = file_content_hash(file)
+    with suppression_store_connection() as conn:
+        prepare_suppression_store(conn)
+        if execute_store_query(conn, "SELECT 1 FROM suppression_files WHERE source_hash = %s", (digest,)).fetchone():
+            return False
+        part = build_index_part(file, property_col, mailing_col)
+        load_store_part(conn, digest, part)
+        execute_store_query(conn, """
+            INSERT INTO suppression_files (source_hash, name, rows, property_column, mailing_column, ingested_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (digest, getattr(file, 'name', str(file)), len(part), property_col, mailing_col,
+              time.strftime('%Y-%m-%d %H:%M:%S'))).close()
+    return True
+
+
+# Function to split normalized needs rows into hits and remaining rows with a semi-join in the store
+def match_against_store(needs_df, scrub_on):
+    key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+    with track_stage('match', len(needs_df)), suppression_store_connection() as conn:
+        prepare_suppression_store(conn)
+        execute_store_query(conn, "DROP TABLE IF EXISTS scrub_keys").close()
+        execute_store_query(conn, f"CREATE TEMP TABLE scrub_keys (row_id BIGINT, {', '.join(f'{col} TEXT' for col in key_columns)})").close()
+        keys = needs_df[key_columns].reset_index(drop=True)
+        bulk_load_frame(conn, 'scrub_keys', keys.assign(row_id=keys.index)[['row_id'] + key_columns])
+
+        query = f"""
+            SELECT t.row_id FROM scrub_keys t WHERE EXISTS (
+                SELECT 1 FROM suppression_keys s WHERE {' AND '.join(f's.{col} = t.{col}' for col in key_columns)}
             )
-        ]
-    elif scrub_on == 'Property Address':
-        needs_df_filtered = needs_df[~needs_df['property_address'].isin(hits_df['property_address'])]
-    elif scrub_on == 'Mailing Address':
-        needs_df_filtered = needs_df[~needs_df['mailing_address'].isin(hits_df['mailing_address'])]
+        """
+        # Stream the hit row numbers back in batches; a named cursor keeps them on the Postgres server
+        cur = conn.cursor() if isinstance(conn, sqlite3.Connection) else conn.cursor(name='scrub_hits')
+        cur.execute(query)
+        hit_rows = [np.array([row[0] for row in rows], dtype=np.int64)
+                    for rows in iter(lambda: cur.fetchmany(suppression_fetch_rows), [])]
+        cur.close()
+        execute_store_query(conn, "DROP TABLE scrub_keys").close()
+
+    is_hit = np.zeros(len(needs_df), dtype=bool)
+    is_hit[np.concatenate(hit_rows or [np.array([], dtype=np.int64)])] = True
+    return needs_df[is_hit].reset_index(drop=True), needs_df[~is_hit]
+
+
+# Function to scrub against the database-backed store
+def scrub_against_store(needs_df, scrub_on):
+    normalize_key_columns(needs_df, scrub_on)
+    return match_against_store(needs_df, scrub_on)
+
+# Optional Dask backend for scrubs too large for one machine, such as re-scrubbing the full
+# history. Both inputs are read as partitioned frames and normalized partition by partition,
+# then shuffled on a hash of the normalized key so all rows with one key land in the same
+# partition, where they are joined like match_addresses. Each partition writes its own hits and
+# filtered file. Runs on a LocalCluster unless given a scheduler address; workers import this
+# module, so the app must be installed on every worker node.
+dask_blocksize = os.getenv("DASK_BLOCKSIZE", "64MB")
+DASK_HELPER_COLUMNS = ['_key_hash', '_order']
+
+
+# Function to read CSV files as one Dask frame of strings, with the address columns renamed and
+# a global row number for keeping the original row order. Files may differ in columns.
+def read_dask_csvs(dd, paths, property_col, mailing_col):
+    frames = [dd.read_csv(path, dtype=str, blocksize=dask_blocksize) for path in paths]
+    frame = frames[0] if len(frames) == 1 else dd.concat(frames)
+    frame = frame.rename(columns={property_col: 'property_address', mailing_col: 'mailing_address'})
+    frame = frame.assign(_order=1)
+    return frame.assign(_order=frame['_order'].cumsum() - 1)
+
+
+# Function to normalize the key columns of a partition and hash its keys. The per-process
+# normalization cache and worker pool are skipped, since each Dask worker is a process already.
+def normalize_dask_partition(df, scrub_on):
+    key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+    df = df.copy()
+    for column in key_columns:
+        df[column] = normalize_address_series(df[column], normalize_unique=compute_normalized_addresses)
+    df['_key_hash'] = hash_address_keys(df, key_columns)
+    return df
+
+
+# Function to match one partition of the file to scrub against the co-partitioned skip traced
+# rows and write the partition's results; returns (hits, rows)
+def scrub_dask_partition(needs_part, skip_part, scrub_on, part_number, output_dir, file_format):
+    key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+    # Restore the original row order, so the first matching skip traced row is the same as in scrub_data
+    needs_part = needs_part.sort_values('_order', kind='stable').drop(columns=DASK_HELPER_COLUMNS).reset_index(drop=True)
+    skip_part = skip_part.sort_values('_order', kind='stable').drop(columns=DASK_HELPER_COLUMNS).reset_index(drop=True)
+    matched_rows = find_matching_rows(needs_part, skip_part, key_columns)
+    hits_df, needs_df_filtered = split_hits(needs_part, skip_part, key_columns, matched_rows)
+
+    extension = 'csv' if file_format == 'zip' else file_format
+    for name, df in [('Hits', hits_df), ('Filtered_file', needs_df_filtered)]:
+        # Text columns are typed as strings even when empty, so every Parquet part has the same schema
+        df = df.astype({col: 'string' for col in df.select_dtypes(include='object').columns})
+        write_result_file(df, os.path.join(output_dir, name, f"part-{part_number:05d}.{extension}"), extension)
+    return len(hits_df), len(needs_part)
+
+
+# Function to scrub files with Dask; writes Hits/ and Filtered_file/ folders of partition files
+# to output_dir and returns (hits, rows scrubbed). scheduler is a scheduler address or a cluster
+# object, such as a LocalCluster(processes=False) in tests.
+def scrub_data_dask(needs_paths, skip_traced_paths, scrub_on, needs_property_col, needs_mailing_col,
+                    combined_property_col, combined_mailing_col, output_dir, file_format='csv', scheduler=None,
+                    partitions=None):
+    try:
+        import dask
+        import dask.dataframe as dd
+        from distributed import Client, LocalCluster
+    except ImportError as e:
+        raise ValueError(f"The Dask backend needs dask and distributed installed: {e}")
+
+    for name in ['Hits', 'Filtered_file']:
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+    with contextlib.ExitStack() as stack:
+        cluster = scheduler or stack.enter_context(LocalCluster())
+        stack.enter_context(Client(cluster))
+
+        needs = read_dask_csvs(dd, needs_paths, needs_property_col, needs_mailing_col)
+        skip = read_dask_csvs(dd, skip_traced_paths, combined_property_col, combined_mailing_col)
+        partitions = partitions or max(needs.npartitions, skip.npartitions)
+        needs = needs.map_partitions(normalize_dask_partition, scrub_on).shuffle('_key_hash', npartitions=partitions)
+        skip = skip.map_partitions(normalize_dask_partition, scrub_on).shuffle('_key_hash', npartitions=partitions)
+
+        with track_stage('match') as record:
+            counts = dask.compute(*[
+                dask.delayed(scrub_dask_partition)(needs_part, skip_part, scrub_on, part_number, output_dir, file_format)
+                for part_number, (needs_part, skip_part) in enumerate(zip(needs.to_delayed(), skip.to_delayed()))
+            ])
+            record['rows'] = sum(rows for _, rows in counts)
+    return sum(hits for hits, _ in counts), sum(rows for _, rows in counts)
+
+
+# Shared suppression data. Normalized skip traced keys are loaded once per server process and
+# shared, read-only, by every session's scrub jobs, so memory grows with the number of distinct
+# datasets rather than users. Each dataset belongs to a family (e.g. the saved index on one
+# scrubbing condition) and has a version; when the history changes, the new version is loaded
+# and the old one is dropped as soon as the last scrub using it releases it. Unused datasets
+# beyond shared_suppression_max_datasets are dropped oldest first.
+shared_suppression_max_datasets = int(os.getenv("SHARED_SUPPRESSION_MAX_DATASETS", "4"))
+
+
+@st.cache_resource(show_spinner=False)
+@lru_cache(maxsize=None)
+def get_shared_suppression_registry():
+    return {'datasets': {}, 'latest': {}, 'lock': threading.Lock()}
+
+
+# Function to drop the datasets no scrub is using that are superseded or beyond the limit.
+# Call with the registry lock held.
+def evict_shared_suppression(registry):
+    unused = [key for key, entry in registry['datasets'].items() if entry['refs'] == 0 and entry['ready'].is_set()]
+    for key in unused:
+        if registry['latest'].get(key[0]) != key[1] or registry['datasets'][key]['data'] is None:
+            del registry['datasets'][key]
+    unused = sorted((entry['last_used'], key) for key, entry in registry['datasets'].items() if entry['refs'] == 0)
+    for _, key in unused[:max(0, len(registry['datasets']) - shared_suppression_max_datasets)]:
+        del registry['datasets'][key]
+
+
+# Function to load the normalized skip traced frame of a dataset and its key index
+def load_shared_suppression(load, scrub_on):
+    with track_stage('index_load') as record:
+        allskipped_df = load()
+        record['rows'] = len(allskipped_df)
+    key_columns = SCRUB_KEY_COLUMNS[scrub_on]
+    return {
+        'allskipped_df': allskipped_df,
+        'key_index': build_key_index(allskipped_df, key_columns),
+        'fuzzy_block_index': None,
+        'fuzzy_lock': threading.Lock(),
+        'memory_mb': allskipped_df.memory_usage(deep=True).sum() / (1 << 20),
+    }
+
+
+# Function to get the fuzzy blocking index of shared data, built by the first fuzzy scrub that needs it
+def shared_fuzzy_block_index(shared, scrub_on):
+    with shared['fuzzy_lock']:
+        if shared['fuzzy_block_index'] is None:
+            shared['fuzzy_block_index'] = build_fuzzy_block_index(shared['allskipped_df'], SCRUB_KEY_COLUMNS[scrub_on])
+        return shared['fuzzy_block_index']
+
+
+# Context manager yielding the shared data of a dataset, loading it with load() unless another
+# scrub already has. Scrubs must treat the frame as read-only.
+@contextmanager
+def shared_suppression(family, version, scrub_on, load):
+    registry = get_shared_suppression_registry()
+    key = (family, version)
+    with registry['lock']:
+        registry['latest'][family] = version
+        entry = registry['datasets'].get(key)
+        loading = entry is None
+        if loading:
+            entry = registry['datasets'][key] = {'data': None, 'refs': 0, 'ready': threading.Event(), 'last_used': time.time()}
+        entry['refs'] += 1
+    try:
+        if loading:
+            try:
+                entry['data'] = load_shared_suppression(load, scrub_on)
+            finally:
+                entry['ready'].set()
+        else:
+            entry['ready'].wait()
+            if entry['data'] is None:
+                raise ValueError("Loading the shared suppression data failed in another scrub")
+        yield entry['data']
+    finally:
+        with registry['lock']:
+            entry['refs'] -= 1
+            entry['last_used'] = time.time()
+            evict_shared_suppression(registry)
+
+
+# Function to summarize the loaded shared datasets for the sidebar
+def shared_suppression_summary():
+    registry = get_shared_suppression_registry()
+    with registry['lock']:
+        loaded = [entry for entry in registry['datasets'].values() if entry['data'] is not None]
+        return len(loaded), sum(entry['data']['memory_mb'] for entry in loaded)
+
+
+# Background scrub jobs. Scrubs run in a thread pool shared by every session on this server,
+# so the page stays responsive and a rerun does not restart them. Each job keeps its status,
+# progress and results in scrub_jobs_dir/<job id>, so a browser refresh or another analyst
+# can pick them up until they expire after scrub_job_retention_hours.
+scrub_jobs_dir = os.getenv("SCRUB_JOBS_DIR", "scrub_jobs")
+scrub_job_workers = int(os.getenv("SCRUB_JOB_WORKERS", "2"))
+scrub_job_retention_hours = float(os.getenv("SCRUB_JOB_RETENTION_HOURS", "72"))
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+
+def save_scrub_job(job):
+    job_path = os.path.join(scrub_jobs_dir, job['id'], 'job.json')
+    with open(job_path + '.tmp', 'w') as job_file:
+        json.dump(job, job_file, indent=2)
+    os.replace(job_path + '.tmp', job_path)
+
+
+def scrub_job_expired(job):
+    return time.time() - job['submitted'] > scrub_job_retention_hours * 3600
+
+
+# Function to remove the expired jobs of a running server and their files, except active ones.
+# Call with state['lock'] held.
+def expire_scrub_jobs(state):
+    for job_id, job in list(state['jobs'].items()):
+        if job['status'] not in ACTIVE_JOB_STATUSES and scrub_job_expired(job):
+            shutil.rmtree(os.path.join(scrub_jobs_dir, job_id), ignore_errors=True)
+            del state['jobs'][job_id]
+
+
+# Function to read the saved jobs, removing expired ones. Jobs that a previous server process
+# left queued or running are marked interrupted.
+def load_scrub_jobs(jobs_dir):
+    jobs = {}
+    for job_path in glob.glob(os.path.join(jobs_dir, '*', 'job.json')):
+        try:
+            with open(job_path) as job_file:
+                job = json.load(job_file)
+        except (OSError, ValueError):
+            continue
+        if scrub_job_expired(job):
+            shutil.rmtree(os.path.dirname(job_path), ignore_errors=True)
+            continue
+        if job['status'] in ACTIVE_JOB_STATUSES:
+            job['status'] = 'interrupted'
+            save_scrub_job(job)
+        jobs[job['id']] = job
+    return jobs
+
+
+# Shared job state: the jobs by id, the cancel events of active jobs and the worker pool
+@st.cache_resource(show_spinner=False)
+@lru_cache(maxsize=None)
+def get_scrub_jobs():
+    os.makedirs(scrub_jobs_dir, exist_ok=True)
+    return {
+        'jobs': load_scrub_jobs(scrub_jobs_dir),
+        'cancel': {},
+        'lock': threading.Lock(),
+        'pool': ThreadPoolExecutor(max_workers=scrub_job_workers, thread_name_prefix='scrub-job'),
+    }
+
+
+# Function to update the fields of a job and save it; returns a copy of the job
+def update_scrub_job(job_id, **changes):
+    state = get_scrub_jobs()
+    with state['lock']:
+        job = state['jobs'][job_id]
+        job.update(changes)
+        save_scrub_job(job)
+        return dict(job)
+
+
+def add_scrub_job_progress(job_id, counter, rows):
+    state = get_scrub_jobs()
+    with state['lock']:
+        job = state['jobs'][job_id]
+        job[counter] += rows
+        save_scrub_job(job)
+
+
+# Function to list the jobs, newest first
+def list_scrub_jobs():
+    state = get_scrub_jobs()
+    with state['lock']:
+        expire_scrub_jobs(state)
+        return sorted((dict(job) for job in state['jobs'].values()), key=lambda job: job['submitted'], reverse=True)
+
+
+def cancel_scrub_job(job_id):
+    state = get_scrub_jobs()
+    with state['lock']:
+        if job_id in state['cancel']:
+            state['cancel'][job_id].set()
+
+
+# Function to submit a scrub of one or more files (a batch) as a background job; returns its id.
+# An active or finished job with the same key is reused instead of scrubbing again. The uploads
+# are copied into the job directory, so the job does not share the file objects with the
+# session's reruns.
+def submit_scrub_job(job_key, description, params, files_to_scrub, skip_traced_files=()):
+    state = get_scrub_jobs()
+    with state['lock']:
+        expire_scrub_jobs(state)
+        for job in state['jobs'].values():
+            if job['key'] == job_key and job['status'] in ACTIVE_JOB_STATUSES + ('done',):
+                return job['id']
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id, 'key': job_key, 'description': description, 'status': 'queued',
+            'submitted': time.time(), 'started': None, 'finished': None,
+            'rows_total': None, 'rows_normalized': 0, 'rows_matched': 0,
+            'hits': None, 'rows': None, 'downloads': [], 'metrics': [], 'batch_summary': None, 'error': None,
+        }
+        os.makedirs(os.path.join(scrub_jobs_dir, job_id, 'inputs'))
+        save_scrub_job(job)
+        state['jobs'][job_id] = job
+        state['cancel'][job_id] = threading.Event()
+
+    inputs_dir = os.path.join(scrub_jobs_dir, job_id, 'inputs')
+    params = dict(params, targets=[], skip_traced=[])
+    for i, upload in enumerate([*files_to_scrub, *skip_traced_files]):
+        path = os.path.join(inputs_dir, f"{i}.csv")
+        upload.seek(0)
+        with open(path, 'wb') as input_file:
+            shutil.copyfileobj(upload, input_file, 1 << 20)
+        upload.seek(0)
+        if i < len(files_to_scrub):
+            params['targets'].append(path)
+        else:
+            params['skip_traced'].append(path)
+    params['target'] = params['targets'][0]
+    state['pool'].submit(run_scrub_job, job_id, params)
+    return job_id
+
+
+# Function to run the scrub a job describes, reporting progress; returns what scrub_chunks does,
+# or scrub_batch for a batch. Skip traced files and the saved index keys come from the shared
+# suppression data.
+def scrub_job_results(job_id, params, cancel):
+    scrub_on = params['scrub_on']
+    if params['source'] == 'store':
+        return scrub_job_chunks(job_id, params, cancel)
+    if params['source'] == 'index' and params['use_fingerprints']:
+        # The fingerprints are memory-mapped, so sessions already share them through the page cache
+        with track_stage('index_load'):
+            fingerprints = load_suppression_fingerprints(scrub_on)
+        return scrub_job_chunks(job_id, params, cancel, fingerprints=fingerprints)
+
+    if params['source'] == 'index':
+        manifest = load_suppression_manifest(suppression_index_dir)
+        family, version = ('index', scrub_on), suppression_index_state(manifest, SCRUB_KEY_COLUMNS[scrub_on])
+
+        def load():
+            return load_suppression_index(scrub_on)
+    else:
+        family = ('files', tuple(params['file_hashes']), tuple(params['auto_mapped_columns']),
+                  params['combined_property_col'], params['combined_mailing_col'], scrub_on)
+        version = rules_version
+
+        def load():
+            combined_df = load_skip_traced(params['skip_traced'], params['auto_mapped_columns'],
+                                           params['combined_property_col'], params['combined_mailing_col'])
+            return normalize_key_columns(combined_df, scrub_on)
+    with shared_suppression(family, version, scrub_on, load) as shared:
+        fuzzy_block_index = shared_fuzzy_block_index(shared, scrub_on) if params['fuzzy_threshold'] is not None else None
+        return scrub_job_chunks(job_id, params, cancel, shared['allskipped_df'], shared['key_index'], fuzzy_block_index)
+
+
+# Function to scrub a job's file to scrub, in chunks, against the loaded suppression data
+def scrub_job_chunks(job_id, params, cancel, allskipped_df=None, key_index=None, fuzzy_block_index=None, fingerprints=None):
+    options = {
+        'output_dir': os.path.join(scrub_jobs_dir, job_id), 'fingerprints': fingerprints,
+        'key_index': key_index, 'fuzzy_block_index': fuzzy_block_index,
+        'use_store': params['source'] == 'store', 'file_format': params['file_format'],
+        'fuzzy_threshold': params['fuzzy_threshold'], 'cancel': cancel,
+        'progress': lambda counter, rows: add_scrub_job_progress(job_id, counter, rows),
+    }
+    if params['batch']:
+        targets = [(name, path, *columns) for name, path, columns in zip(params['target_names'], params['targets'], params['target_columns'])]
+        return scrub_batch(targets, allskipped_df, params['scrub_on'], **options)
+    if params['stream']:
+        return scrub_file_in_chunks(params['target'], allskipped_df, params['scrub_on'],
+                                    params['needs_property_col'], params['needs_mailing_col'], **options)
+
+    with track_stage('csv_load') as record:
+        needs_df = pd.read_csv(params['target'])
+        record['rows'] = len(needs_df)
+    update_scrub_job(job_id, rows_total=len(needs_df))
+    # Matching per chunk gives the same rows as matching at once, with progress in between
+    chunks = (needs_df.iloc[start:start + scrub_chunk_rows] for start in range(0, len(needs_df), scrub_chunk_rows))
+    return scrub_chunks(chunks, allskipped_df, params['scrub_on'], params['needs_property_col'], params['needs_mailing_col'], **options)
+
+
+# Function to run a job in a worker thread and record its outcome
+def run_scrub_job(job_id, params):
+    state = get_scrub_jobs()
+    cancel = state['cancel'][job_id]
+    job_dir = os.path.join(scrub_jobs_dir, job_id)
+    try:
+        if cancel.is_set():
+            update_scrub_job(job_id, status='cancelled', finished=time.time())
+            return
+        update_scrub_job(job_id, status='running', started=time.time())
+        start_stage_metrics()
+        with profile_run(os.path.join(job_dir, 'profile.pstats'), enabled=params.get('profile', False)):
+            results = scrub_job_results(job_id, params, cancel)
+        if params['batch']:
+            paths, batch_summary = results
+            hit_count, row_count = sum(row['hits'] for row in batch_summary), sum(row['rows'] for row in batch_summary)
+        else:
+            hits_path, filtered_path, hit_count, row_count = results
+            paths, batch_summary = [hits_path, filtered_path], None
+        if cancel.is_set():
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            update_scrub_job(job_id, status='cancelled', finished=time.time())
+            return
+
+        if not params['batch']:
+            # Page files are written before the zip format bundles the result files
+            with track_stage('preview_pages', row_count):
+                write_page_file(hits_path, os.path.join(job_dir, 'page_hits.parquet'))
+                write_page_file(filtered_path, os.path.join(job_dir, 'page_filtered.parquet'))
+            paths = finish_result_files(hits_path, filtered_path, params['file_format'])
+        # The writer thread updates the database later; this only times queuing the hits
+        with track_stage('hit_counter_enqueue'):
+            record_hits(hit_count)
+        update_scrub_job(job_id, status='done', finished=time.time(), hits=hit_count, rows=row_count,
+                         downloads=[os.path.basename(path) for path in paths], metrics=stage_metrics_report(),
+                         batch_summary=batch_summary)
+    except Exception as e:
+        print(f"Error running scrub job {job_id}: {e}")
+        update_scrub_job(job_id, status='failed', finished=time.time(), error=str(e))
+    finally:
+        shutil.rmtree(os.path.join(job_dir, 'inputs'), ignore_errors=True)
+        with state['lock']:
+            state['cancel'].pop(job_id, None)
+
+
+# Function to describe a job's progress in one line
+def scrub_job_progress_text(job):
+    if job['status'] == 'done':
+        return f"{job['hits']} hits in {job['rows']} rows"
+    if job['status'] == 'failed':
+        return job['error']
+    total = f" of {job['rows_total']}" if job['rows_total'] else ""
+    return f"{job['rows_normalized']}{total} rows normalized, {job['rows_matched']} matched"
+
+
+# Function to show the table of jobs on this server
+def show_scrub_jobs_table(jobs):
+    st.dataframe(pd.DataFrame([{
+        'job': job['id'],
+        'description': job['description'],
+        'status': job['status'],
+        'submitted': time.strftime('%Y-%m-%d %H:%M', time.localtime(job['submitted'])),
+        'progress': scrub_job_progress_text(job),
+    } for job in jobs]), hide_index=True)
+
+
+# Function to show the jobs table and the progress of an active job. Only this fragment reruns
+# every second, so polling does not rerun the script (and rehash the uploads); once the job
+# has finished the whole page reruns to show its results.
+@st.experimental_fragment(run_every=1)
+def show_active_scrub_job(job_id):
+    jobs = list_scrub_jobs()
+    job = next((job for job in jobs if job['id'] == job_id), None)
+    if job is None or job['status'] not in ACTIVE_JOB_STATUSES:
+        st.rerun()
+    show_scrub_jobs_table(jobs)
+    st.write(f"Job {job_id} is {job['status']}: {scrub_job_progress_text(job)}")
+    if job['rows_total']:
+        st.progress(min(1.0, job['rows_matched'] / job['rows_total']))
+    if st.button("Cancel this job"):
+        cancel_scrub_job(job_id)
+
+
+# Function to show the jobs on this server and the progress or results of the selected one
+def show_scrub_jobs(current_job_id=None):
+    jobs = list_scrub_jobs()
+    if not jobs:
+        return
+    st.header("Scrub Jobs")
+    job_ids = [job['id'] for job in jobs]
+    job_id = st.selectbox("Show job", job_ids, index=job_ids.index(current_job_id) if current_job_id in job_ids else 0,
+                          format_func=lambda job_id: f"{job_id}: {jobs[job_ids.index(job_id)]['description']}")
+    job = jobs[job_ids.index(job_id)]
+    job_dir = os.path.join(scrub_jobs_dir, job_id)
+
+    if job['status'] in ACTIVE_JOB_STATUSES:
+        show_active_scrub_job(job_id)
+        return
+    show_scrub_jobs_table(jobs)
+    if job['status'] != 'done':
+        st.write(f"Job {job_id} {job['status']}" + (f": {job['error']}" if job['error'] else "."))
+        return
+
+    # Display results
+    st.header("Scrubbing Results")
+    st.write(f"Current Hits: {job['hits']}")
+    if job.get('batch_summary') is not None:
+        st.subheader(f"Hits per file ({len(job['batch_summary'])} files):")
+        st.dataframe(pd.DataFrame(job['batch_summary'], columns=['target', 'rows', 'hits', 'remaining']), hide_index=True)
+    elif job['hits']:
+        st.subheader("Hits DataFrame:")
+        show_page_file_preview("Hits", os.path.join(job_dir, 'page_hits.parquet'), key='hits_page')
+    else:
+        st.write("No hits found based on the selected condition.")
+
+    if job.get('batch_summary') is None:
+        st.subheader("Filtered DataFrame (after scrubbing):")
+        show_page_file_preview("Filtered file", os.path.join(job_dir, 'page_filtered.parquet'), key='filtered_page')
+
+    # Option to download results
+    show_result_downloads([os.path.join(job_dir, file_name) for file_name in job['downloads']])
+    show_stage_metrics(job['metrics'])
+    if os.path.exists(os.path.join(job_dir, 'profile.pstats')):
+        show_profile(os.path.join(job_dir, 'profile.pstats'))
 
-    return hits_df, needs_df_filtered
 
 # Streamlit App
 def main():
     st.title("Skip Traced Scrubber with Auto-mapping")
+    start_stage_metrics()
+
+    with st.sidebar:
+        st.subheader("Offline ZIP to city index")
+        zip_index = load_zip_city_index()
+        st.write(f"{zip_index.num_rows} ZIP codes indexed" if zip_index is not None else "No ZIP index built yet")
+        zip_reference_file = st.file_uploader("ZIP reference file (CSV with ZIP and city columns)", type="csv")
+        if zip_reference_file and st.button("Build ZIP index"):
+            try:
+                st.success(f"Indexed {build_zip_city_index(zip_reference_file)} ZIP codes")
+            except ValueError as e:
+                st.error(f"Error building ZIP index: {e}")
+        st.subheader("Shared suppression data")
+        shared_datasets, shared_memory_mb = shared_suppression_summary()
+        st.write(f"{shared_datasets} dataset(s) loaded for all sessions, {shared_memory_mb:.0f} MB")
 
     st.header("Step 1: Upload Skip Traced Files")
-    uploaded_files = st.file_uploader(
-        "Upload Skip Traced Files (CSV)", type="csv", accept_multiple_files=True
-    )
+    use_saved_index = st.checkbox("Scrub against the saved suppression index instead of uploading files")
+    uploaded_files = None
+    if use_saved_index:
+        if suppression_store == 'files':
+            manifest = load_suppression_manifest(suppression_index_dir)
+            indexed_files = len(manifest['files'])
+            indexed_rows = sum(entry['rows'] for entry in manifest['files'].values())
+        else:
+            try:
+                indexed_files, indexed_rows = suppression_store_summary()
+            except (ConnectionError, sqlite3.Error, psycopg2.Error) as e:
+                st.error(f"Error opening the suppression store: {e}")
+                indexed_files, indexed_rows = 0, 0
+        st.write(f"Saved suppression index: {indexed_files} files, {indexed_rows} addresses")
+        if not indexed_files:
+            st.warning("The saved suppression index is empty. Upload skip traced files and add them to it first.")
+        # The database store matches on the server, so fingerprints only apply to the index files
+        use_fingerprints = suppression_store == 'files' and st.checkbox(
+            "Match on compact key fingerprints (about 8 bytes per address instead of the address text)", value=True
+        )
+        # The index stores both standardized address columns
+        combined_property_col, combined_mailing_col = 'property_address', 'mailing_address'
+    else:
+        uploaded_files = st.file_uploader(
+            "Upload Skip Traced Files (CSV)", type="csv", accept_multiple_files=True
+        )
 
-    if uploaded_files:
-        combined_df = load_and_combine_files(uploaded_files)
+    if uploaded_files or (use_saved_index and indexed_files):
+        if uploaded_files:
+            # The mapping needs only the headers; the files are hashed and loaded when Scrub is pressed
+            combined_columns = list(dict.fromkeys(col for uploaded_file in uploaded_files for col in read_csv_columns(uploaded_file)))
 
-        # Auto-map columns for combined_df
-        combined_property_col, combined_mailing_col = auto_map_columns(combined_df)
-        combined_df = combined_df.drop_duplicates(subset=[col for col in [combined_property_col, combined_mailing_col] if col in combined_df.columns])
+            # Auto-map columns for combined_df
+            auto_mapped_columns = auto_map_columns(pd.DataFrame(columns=combined_columns))
+            combined_property_col, combined_mailing_col = auto_mapped_columns
 
+            # Allow users to manually adjust the mapping for combined_df
+            st.subheader("Column Mapping for Combined DataFrame:")
+            options = ['None'] + combined_columns
 
-        # Allow users to manually adjust the mapping for combined_df
-        st.subheader("Column Mapping for Combined DataFrame:")
-        options = ['None'] + list(combined_df.columns)
+            # Selectbox for Property Address column
+            combined_property_col = st.selectbox(
+                "Select the Property Address column for combined data",
+                options=options,  # Provide the options list
+                index=options.index(combined_property_col) if combined_property_col in options else 0  # Pre-select automapped column
+            )
 
-        # Selectbox for Property Address column
-        combined_property_col = st.selectbox(
-            "Select the Property Address column for combined data",
-            options=options,  # Provide the options list
-            index=options.index(combined_property_col) if combined_property_col in options else 0  # Pre-select automapped column
-        )
+            # Selectbox for Mailing Address column
+            combined_mailing_col = st.selectbox(
+                "Select the Mailing Address column for combined data",
+                options=options,  # Provide the options list
+                index=options.index(combined_mailing_col) if combined_mailing_col in options else 0  # Pre-select automapped column
+            )
+            st.subheader("Combined DataFrame:")
+            show_uploads_preview(f"{len(uploaded_files)} file(s)", uploaded_files, key='combined_page')
 
-        # Selectbox for Mailing Address column
-        combined_mailing_col = st.selectbox(
-            "Select the Mailing Address column for combined data",
-            options=options,  # Provide the options list
-            index=options.index(combined_mailing_col) if combined_mailing_col in options else 0  # Pre-select automapped column
-        )
-        combined_df = combined_df.drop_duplicates(subset=[col for col in [combined_property_col, combined_mailing_col] if col in combined_df.columns])
-        st.subheader("Combined DataFrame:")
-        st.dataframe(combined_df)
-        # Rename columns in combined_df to standardized names
-        combined_df = combined_df.rename(columns={
-            combined_property_col: 'property_address',
-            combined_mailing_col: 'mailing_address'
-        })
-        
+            if st.button("Add these files to the saved suppression index"):
+                if combined_property_col == 'None' and combined_mailing_col == 'None':
+                    st.error("Please map at least one address column before adding files to the index.")
+                else:
+                    add_file = ingest_suppression_file if suppression_store == 'files' else store_suppression_file
+                    added = sum(
+                        add_file(uploaded_file, combined_property_col, combined_mailing_col)
+                        for uploaded_file in uploaded_files
+                    )
+                    st.success(f"Added {added} new file(s) to the suppression index; {len(uploaded_files) - added} were already indexed.")
 
-        st.success("Combined DataFrame columns.")
-        st.success("dropped dups in combined files")
         # Step 2: User selects conditions for scrubbing
         st.header("Step 2: Select Scrubbing Conditions")
         scrub_on = st.selectbox(
             "Choose the scrubbing condition",
             ['Both', 'Property Address', 'Mailing Address']
         )
+        fuzzy_matching = st.checkbox("Fuzzy matching (also count near matches, such as typos in the street name)")
+        fuzzy_threshold = st.slider("Minimum similarity score", 50, 100, 90) if fuzzy_matching else None
 
         # Step 3: Upload the file to scrub against
         st.header("Step 3: Upload File to Scrub Against")
-        file_to_scrub = st.file_uploader(
-            "Upload the File to Scrub Against (CSV)", type="csv"
+        # Several files are scrubbed as one batch, sharing the suppression data and the normalization
+        files_to_scrub = st.file_uploader(
+            "Upload the File to Scrub Against (CSV)", type="csv", accept_multiple_files=True
         )
 
-        if file_to_scrub:
-            needs_df = pd.read_csv(file_to_scrub)
+        if files_to_scrub:
+            file_to_scrub = files_to_scrub[0]
+            batch_scrub = len(files_to_scrub) > 1
+            stream_scrub = not batch_scrub and st.checkbox("Stream the file to scrub in chunks (for files too large to load at once)")
+            # Only a sample is read for the mapping; the preview pages the file and the scrub reads it whole
+            needs_sample = load_csv_file(upload_key(file_to_scrub), file_to_scrub, nrows=preview_sample_rows)
             st.subheader("File to Scrub:")
-            st.dataframe(needs_df)
+            show_uploads_preview("File to scrub", [file_to_scrub], key='needs_page')
 
             # Auto-map columns for needs_df
-            needs_property_col, needs_mailing_col = auto_map_columns(needs_df)
+            needs_property_col, needs_mailing_col = auto_map_columns(needs_sample)
 
             st.subheader("Column Mapping for Needs DataFrame:")
-            options_needs = ['None'] + list(needs_df.columns)
+            options_needs = ['None'] + list(needs_sample.columns)
 
             # Selectbox for Property Address column in needs_df
             needs_property_col = st.selectbox(
@@ -773,74 +3149,77 @@ def main():
                 options=options_needs,  # Provide the options list
                 index=options_needs.index(needs_mailing_col) if needs_mailing_col in options_needs else 0  # Pre-select automapped column
             )
-
-            # Rename columns in needs_df to standardized names
-            needs_df = needs_df.rename(columns={
-                needs_property_col: 'property_address',
-                needs_mailing_col: 'mailing_address'
-            })
+            if batch_scrub:
+                # The mapping above applies to every file that has the chosen columns; the others are auto-mapped
+                st.write(f"Scrubbing {len(files_to_scrub)} files as one batch. The mapping above applies to the "
+                         f"other files that have the same columns; the rest are mapped automatically.")
+                target_columns = []
+                for target_file in files_to_scrub:
+                    target_header = read_csv_columns(target_file)
+                    auto_columns = auto_map_columns(pd.DataFrame(columns=target_header))
+                    target_columns.append(tuple(
+                        chosen if chosen in target_header else auto
+                        for chosen, auto in zip([needs_property_col, needs_mailing_col], auto_columns)
+                    ))
 
 
             
-            conn = connect_to_postgres()
-
-        # Ensure table is created
         # Fetch current total hits
-            total_hits = get_total_hits(conn)
+            with postgres_connection() as conn:
+                total_hits = get_total_hits(conn) if conn else 0
             st.write(f"Total Hits from Previous Sessions: {total_hits}")
+            # Chosen before the scrub so only this format is written
+            export_format = EXPORT_FORMATS[st.radio("Download format", list(EXPORT_FORMATS), horizontal=True)]
+            profile_scrub = st.checkbox("Profile this scrub (shows where the time goes; normalization runs in one process, so it is slower)",
+                                        value=profile_scrubs)
             if st.button('Scrub'):
-                if scrub_on == 'Both':
-                    if combined_property_col == 'None' or combined_mailing_col == 'None' or needs_property_col == 'None' or needs_mailing_col == 'None':
-                        st.error("Please map both Property Address and Mailing Address columns for both datasets.")
-                    else:
-                        hits_df, needs_df_filtered = scrub_data(needs_df, combined_df, scrub_on)
-                elif scrub_on =='Property Address':
-                    if combined_property_col == 'None' or needs_property_col == 'None':
-                        st.error("Please map both Property Address for both datasets.")
-                    else:
-                        hits_df, needs_df_filtered = scrub_data(needs_df, combined_df, scrub_on)
-                elif scrub_on =='Mailing Address':
-                    if combined_mailing_col == 'None' or needs_mailing_col == 'None':
-                        st.error("Please map both Property Address for both datasets.")
-                    else:         
-                        hits_df, needs_df_filtered = scrub_data(needs_df, combined_df, scrub_on)
-                # Perform the scrubbing process using standardized columns
-                
-
-                # Display results
-                st.header("Scrubbing Results")
-                current_hits = len(hits_df)
-                st.write(f"Current Hits: {current_hits}")
-
-    # Update the total hits in the database
-                update_total_hits(conn, current_hits)
-
-    # Display updated total hits
-                total_hits += current_hits
-                st.write(f"Total Hits Across All Sessions: {total_hits}")
-                conn.close()
-
-
-                if not hits_df.empty:
-                    st.subheader("Hits DataFrame:")
-                    st.dataframe(hits_df)
+                mapping_error = check_column_mapping(scrub_on, combined_property_col, combined_mailing_col, needs_property_col, needs_mailing_col)
+                if fuzzy_threshold is not None and (stream_scrub or (use_saved_index and suppression_store != 'files')):
+                    mapping_error = "Fuzzy matching works when the file to scrub is loaded at once and the suppression data is uploaded files or the saved index files."
+                if batch_scrub and not mapping_error:
+                    for target_file, (target_property_col, target_mailing_col) in zip(files_to_scrub, target_columns):
+                        target_error = check_column_mapping(scrub_on, combined_property_col, combined_mailing_col, target_property_col, target_mailing_col)
+                        if target_error:
+                            mapping_error = f"{target_file.name}: {target_error}"
+                            break
+                if mapping_error:
+                    st.error(mapping_error)
                 else:
-                    st.write("No hits found based on the selected condition.")
-
-                st.subheader("Filtered DataFrame (after scrubbing):")
-                st.dataframe(needs_df_filtered)
-                hits_df['property_address'] = hits_df['property_address'].str.title()
-                hits_df['mailing_address'] = hits_df['mailing_address'].str.title()
-
-                needs_df_filtered['property_address'] = needs_df_filtered['property_address'].str.title()
-                needs_df_filtered['mailing_address'] = needs_df_filtered['mailing_address'].str.title()
-
-                # Option to download results
-                hits_csv = hits_df.to_csv(index=False).encode('utf-8')
-                filtered_csv = needs_df_filtered.to_csv(index=False).encode('utf-8')
-                
-                st.download_button(label="Download the hits", data=hits_df.to_csv(index=False).encode('utf-8'), file_name="Hits.csv", mime="text/csv")
-                st.download_button(label="Download Filtered file", data=needs_df_filtered.to_csv(index=False).encode('utf-8'), file_name="Filtered_file.csv", mime="text/csv")
+                    # The scrub runs as a background job; the same inputs reuse the job instead of scrubbing again
+                    params = {
+                        'source': ('index' if suppression_store == 'files' else 'store') if use_saved_index else 'files',
+                        'use_fingerprints': use_saved_index and use_fingerprints and fuzzy_threshold is None,
+                        'file_hashes': tuple(session_file_hash(uploaded_file) for uploaded_file in uploaded_files) if uploaded_files else None,
+                        'auto_mapped_columns': auto_mapped_columns if uploaded_files else None,
+                        'combined_property_col': combined_property_col,
+                        'combined_mailing_col': combined_mailing_col,
+                        'needs_property_col': needs_property_col,
+                        'needs_mailing_col': needs_mailing_col,
+                        'scrub_on': scrub_on,
+                        'fuzzy_threshold': fuzzy_threshold,
+                        'stream': stream_scrub,
+                        'file_format': export_format,
+                        'profile': profile_scrub,
+                        'batch': batch_scrub,
+                        'target_names': [target_file.name for target_file in files_to_scrub] if batch_scrub else None,
+                        'target_columns': target_columns if batch_scrub else None,
+                    }
+                    # The saved index's size stands in for its contents, so adding files to it scrubs again
+                    index_version = (indexed_files, indexed_rows) if use_saved_index else None
+                    if batch_scrub:
+                        needs_key = tuple(zip([session_file_hash(target_file) for target_file in files_to_scrub], target_columns))
+                    else:
+                        needs_key = (session_file_hash(file_to_scrub), needs_property_col, needs_mailing_col)
+                    job_key = hashlib.sha256(repr((needs_key, index_version, rules_version, sorted(params.items()))).encode()).hexdigest()
+                    source_name = f"{len(uploaded_files)} skip traced file(s)" if uploaded_files else "the saved index"
+                    fuzzy_name = f", fuzzy >= {fuzzy_threshold}" if fuzzy_threshold is not None else ""
+                    target_name = f"{len(files_to_scrub)} files" if batch_scrub else file_to_scrub.name
+                    st.session_state['scrub_job_id'] = submit_scrub_job(
+                        job_key, f"{target_name} against {source_name} on {scrub_on}{fuzzy_name}",
+                        params, files_to_scrub, uploaded_files or ()
+                    )
+
+    show_scrub_jobs(st.session_state.get('scrub_job_id'))
 
 if __name__ == "__main__":
     main()
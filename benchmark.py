@@ -0,0 +1,228 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Benchmarks for the normalization and scrub hot paths of app.py on a seeded synthetic corpus.
+# Each case runs in a fresh process so its peak RSS is its own. Results are appended to a JSON
+# file tagged with the git commit, so runs can be compared across commits:
+#
+#     python benchmark.py --sizes 10000 1000000 10000000 --output benchmark_results.json
+
+SCRUB_MODES = ['Both', 'Property Address', 'Mailing Address']
+STREET_NAMES = [
+    'Maple', 'Oak', 'Pine', 'Cedar', 'Elm', 'Washington', 'Lake', 'Hill', 'Park', 'Hunting Hollow',
+    'Sunset', 'Ridge', 'Lincoln', 'Jefferson', 'Mill', 'Church', 'Spring', 'River', 'Forest', 'Highland',
+]
+UNIT_FORMATS = ['', '', '', ' apt {}', ' #{}', ' # {}', ' unit {}', ' #-{}', ' {}-unit', ' ste {}']
+ROUTE_WORDS = ['state rte', 'State Route', 'state rt']
+
+
+# Function to group the spellings of each rule table by the canonical form they normalize to
+def spelling_groups(app, rules):
+    groups = {}
+    for pattern, replacement in rules:
+        token = app.rule_token_pattern.fullmatch(pattern.pattern).group(1)
+        groups.setdefault(replacement, []).extend([token, token + '.'])
+    return list(groups.values())
+
+
+# Function to draw one spelling per row from its group, in mixed case
+def pick_spellings(rng, groups, group_ids):
+    spellings = np.empty(len(group_ids), dtype=object)
+    for group_id in np.unique(group_ids):
+        rows = np.flatnonzero(group_ids == group_id)
+        spellings[rows] = np.array(groups[group_id], dtype=object)[rng.integers(len(groups[group_id]), size=len(rows))]
+    case = rng.integers(3, size=len(group_ids))
+    spellings = pd.Series(spellings)
+    return spellings.where(case != 1, spellings.str.upper()).where(case != 2, spellings.str.title())
+
+
+# Function to collect the spelling groups of streets, suffixes and directionals from app's rule tables
+def address_vocabulary(app):
+    ordinal_groups = {}
+    for phrase, ordinal in app.ordinal_mapping.items():
+        ordinal_groups.setdefault(ordinal, []).append(phrase)
+    return {
+        'street': [[name] for name in STREET_NAMES] + list(ordinal_groups.values()),
+        'suffix': spelling_groups(app, app.address_patterns),
+        'directional': spelling_groups(app, app.directional_patterns.items()),
+    }
+
+
+# Function to draw the structure of n addresses: which street, suffix, unit and shape each row has
+def generate_address_parts(vocabulary, n, rng):
+    directionals = len(vocabulary['directional'])
+    return {
+        'number': rng.integers(1, 20000, size=n),
+        # Mostly named streets, the rest spelled-out ordinals
+        'street': np.where(rng.random(n) < 0.6, rng.integers(len(STREET_NAMES), size=n),
+                           rng.integers(len(vocabulary['street']), size=n)),
+        'suffix': rng.integers(len(vocabulary['suffix']), size=n),
+        # Negative draws mean no directional
+        'directional': rng.integers(-directionals, directionals, size=n),
+        'unit': rng.integers(len(UNIT_FORMATS), size=n),
+        'unit_number': rng.integers(1, 400, size=n),
+        # 0: plain street address, 1: duplex range, 2: state route
+        'shape': rng.choice(3, size=n, p=[0.9, 0.06, 0.04]),
+        'duplex_step': rng.choice([2, 3, 4, 6, 8], size=n),
+        'route': rng.integers(1, 300, size=n),
+    }
+
+
+# Function to render address parts as text. The same parts rendered with different generators
+# give differently spelled versions of the same addresses, which normalize to the same key.
+def render_addresses(vocabulary, parts, rng):
+    n = len(parts['number'])
+    number = pd.Series(parts['number']).astype(str)
+    street = pick_spellings(rng, vocabulary['street'], parts['street'])
+    suffix = pick_spellings(rng, vocabulary['suffix'], parts['suffix'])
+    directional = pick_spellings(rng, vocabulary['directional'], np.maximum(parts['directional'], 0))
+    directional = (directional + ' ').where(parts['directional'] >= 0, '')
+    unit = pd.Series([UNIT_FORMATS[u].format(v) for u, v in zip(parts['unit'], parts['unit_number'])])
+
+    plain = number + ' ' + directional + street + ' ' + suffix + unit
+    duplex = number + ' ' + street + ' ' + suffix + ' ' + pd.Series(parts['number'] + parts['duplex_step']).astype(str)
+    route_word = pd.Series(np.array(ROUTE_WORDS, dtype=object)[rng.integers(len(ROUTE_WORDS), size=n)])
+    state_route = number + ' - ' + pd.Series(parts['route']).astype(str) + ' ' + directional + route_word
+    return plain.where(parts['shape'] == 0, duplex.where(parts['shape'] == 1, state_route))
+
+
+# Function to generate a file to scrub and a skip traced file sharing about a third of their addresses
+def generate_scrub_frames(app, n, seed):
+    rng = np.random.default_rng(seed)
+    vocabulary = address_vocabulary(app)
+    property_parts = generate_address_parts(vocabulary, n, rng)
+    mailing_parts = {key: np.where(rng.random(n) < 0.7, values, np.roll(values, 1)) for key, values in property_parts.items()}
+    needs_df = pd.DataFrame({
+        'owner_id': np.arange(n),
+        'property_address': render_addresses(vocabulary, property_parts, rng),
+        'mailing_address': render_addresses(vocabulary, mailing_parts, rng),
+    })
+
+    # Skip traced rows: a third re-spell needs rows, the rest are other addresses
+    shared = rng.random(n) < 1 / 3
+    other_parts = generate_address_parts(vocabulary, n, rng)
+    skip_property_parts = {key: np.where(shared, property_parts[key], other_parts[key]) for key in property_parts}
+    skip_mailing_parts = {key: np.where(shared, mailing_parts[key], other_parts[key]) for key in mailing_parts}
+    allskipped_df = pd.DataFrame({
+        'phone': pd.Series(rng.integers(2000000000, 9999999999, size=n)).astype(str),
+        'property_address': render_addresses(vocabulary, skip_property_parts, rng),
+        'mailing_address': render_addresses(vocabulary, skip_mailing_parts, rng),
+    })
+    return needs_df, allskipped_df
+
+
+# Function to run one benchmark case in the current process and measure it
+def run_case(case):
+    benchmark, rows, mode, seed, scalar_rows = case
+    # The persistent normalization cache would turn repeated runs into lookups
+    os.environ['NORMALIZATION_CACHE_PATH'] = ''
+    import app
+
+    if benchmark in ('preprocess_address', 'standardize_and_normalize_address'):
+        rows = min(rows, scalar_rows)
+    needs_df, allskipped_df = generate_scrub_frames(app, rows, seed)
+    if benchmark in ('preprocess_address', 'standardize_and_normalize_address'):
+        addresses = needs_df['property_address'].tolist()
+        if benchmark == 'standardize_and_normalize_address':
+            addresses = [app.preprocess_address(address) for address in addresses]
+        func = getattr(app, benchmark)
+        start = time.perf_counter()
+        for address in addresses:
+            func(address)
+        seconds = time.perf_counter() - start
+        measured_rows = len(addresses)
+    elif benchmark == 'load_and_combine_files':
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i, part_rows in enumerate(np.array_split(np.arange(len(needs_df)), 4)):
+                paths.append(os.path.join(directory, f"part{i}.csv"))
+                needs_df.iloc[part_rows].to_csv(paths[-1], index=False)
+            start = time.perf_counter()
+            app.load_and_combine_files(paths)
+            seconds = time.perf_counter() - start
+        measured_rows = len(needs_df)
+    else:
+        start = time.perf_counter()
+        hits_df, _ = app.scrub_data(needs_df, allskipped_df, mode)
+        seconds = time.perf_counter() - start
+        measured_rows = len(needs_df) + len(allskipped_df)
+
+    return {
+        'benchmark': benchmark,
+        'mode': mode,
+        'rows': measured_rows,
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(measured_rows / seconds) if seconds > 0 else None,
+        'peak_rss_mb': round(app.peak_memory_mb(), 1),
+        'hits': len(hits_df) if benchmark == 'scrub_data' else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark address normalization and scrubbing on synthetic data.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 1000000, 10000000])
+    parser.add_argument('--modes', nargs='+', default=SCRUB_MODES, choices=SCRUB_MODES)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scalar-rows', type=int, default=100000,
+                        help="cap on rows for the per-address scalar benchmarks")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    cases = []
+    for rows in args.sizes:
+        cases.append(('preprocess_address', rows, None, args.seed, args.scalar_rows))
+        cases.append(('standardize_and_normalize_address', rows, None, args.seed, args.scalar_rows))
+        cases.append(('load_and_combine_files', rows, None, args.seed, args.scalar_rows))
+        cases.extend(('scrub_data', rows, mode, args.seed, args.scalar_rows) for mode in args.modes)
+
+    # A fresh spawned process per case keeps the peak RSS of one case out of the next
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for case in cases:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_case, (case,))
+        results.append(result)
+        print(f"{result['benchmark']:<36} {str(result['mode'] or ''):<17} {result['rows']:>10} rows "
+              f"{result['seconds']:>9.3f}s {result['rows_per_sec'] or 0:>10} rows/s {result['peak_rss_mb']:>8} MB")
+
+    try:
+        with open(args.output) as results_file:
+            runs = json.load(results_file)
+    except (OSError, ValueError):
+        runs = []
+    runs.append({
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'results': results,
+    })
+    with open(args.output, 'w') as results_file:
+        json.dump(runs, results_file, indent=2)
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+import app
+
+# Headless entry point for scheduled jobs: runs the same normalization and matching as the
+# Streamlit app in one process and writes the hits and filtered files to an output directory.
+#
+#     python scrub_cli.py --skip-traced skip1.csv skip2.csv --target list.csv --scrub-on Both --output-dir out/
+#
+# Several --target files are scrubbed as one batch, with per-file results and Batch_summary.csv.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrub a file against skip traced files without the Streamlit UI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--skip-traced', nargs='+', metavar='CSV', help="skip traced files to scrub against")
+    source.add_argument('--saved-index', action='store_true',
+                        help="scrub against the saved suppression index (or the SUPPRESSION_STORE database)")
+    parser.add_argument('--target', required=True, nargs='+', metavar='CSV',
+                        help="file to scrub; several files are scrubbed as one batch")
+    parser.add_argument('--scrub-on', default='Both', choices=list(app.SCRUB_KEY_COLUMNS))
+    parser.add_argument('--skip-property-col', help="property address column of the skip traced files (auto-mapped by default)")
+    parser.add_argument('--skip-mailing-col', help="mailing address column of the skip traced files (auto-mapped by default)")
+    parser.add_argument('--target-property-col', help="property address column of the target files (auto-mapped by default)")
+    parser.add_argument('--target-mailing-col', help="mailing address column of the target files (auto-mapped by default)")
+    parser.add_argument('--output-dir', default='.', help="directory for the hits and filtered files")
+    parser.add_argument('--format', default='csv', choices=list(app.EXPORT_MIME_TYPES),
+                        help="result file format; zip bundles both results as CSV files")
+    parser.add_argument('--stream', action='store_true', help="read the target file in chunks of SCRUB_CHUNK_ROWS rows")
+    parser.add_argument('--chunk-rows', type=int, default=app.scrub_chunk_rows)
+    parser.add_argument('--project', action='store_true',
+                        help="load only the address columns of the skip traced files, and their other columns for hits only")
+    parser.add_argument('--fuzzy-threshold', type=float, metavar='SCORE',
+                        help="also count near matches scoring at least SCORE (0-100) as hits")
+    parser.add_argument('--dask', action='store_true',
+                        help="scrub with Dask, writing Hits/ and Filtered_file/ folders with one file per partition")
+    parser.add_argument('--dask-scheduler', metavar='ADDRESS',
+                        help="Dask scheduler to run on (a LocalCluster is started by default)")
+    parser.add_argument('--dask-partitions', type=int, metavar='N',
+                        help="partitions to hash the keys into (the number of input blocks by default)")
+    parser.add_argument('--update-hit-counter', action='store_true', help="add the hits to the Postgres hit counter")
+    parser.add_argument('--metrics', metavar='JSON', help="write the per-stage timings to this file")
+    parser.add_argument('--profile', metavar='PSTATS', default='scrub_profile.pstats' if app.profile_scrubs else None,
+                        help="profile the scrub and write the stats to this file (on by default with PROFILE_SCRUBS=1; normalization then runs in one process)")
+    parser.add_argument('--rule-hits', metavar='JSON', help="write the rows each preprocessing rule changed to this file")
+    args = parser.parse_args(argv)
+    if args.project and (args.stream or args.saved_index):
+        parser.error("--project works with --skip-traced files scrubbed in memory")
+    if args.fuzzy_threshold is not None and (args.stream or (args.saved_index and app.suppression_store != 'files')):
+        parser.error("--fuzzy-threshold works with in-memory scrubs against --skip-traced files or the saved index files")
+    if len(args.target) > 1 and (args.stream or args.project or args.dask):
+        parser.error("several --target files are scrubbed as a batch, which works without --stream, --project and --dask")
+    if args.dask and (not args.skip_traced or args.stream or args.project or args.fuzzy_threshold is not None
+                      or args.format == 'zip'):
+        parser.error("--dask works with --skip-traced files and exact matching, written as CSV or Parquet files")
+    return args
+
+
+# Function to reject column names given on the command line that the file does not have
+def check_columns_exist(file_name, columns, requested_columns):
+    for column in requested_columns:
+        if column and column not in columns:
+            raise ValueError(f"Column '{column}' not found in {file_name}")
+
+
+# Function to run one scrub from the parsed arguments; returns (hits, rows scrubbed)
+def run_scrub(args):
+    if args.saved_index:
+        combined_df = None
+        combined_property_col, combined_mailing_col = 'property_address', 'mailing_address'
+    else:
+        # Map the columns from the headers, so --project can load only the mapped ones
+        skip_traced_columns = list(dict.fromkeys(col for file in args.skip_traced for col in app.read_csv_columns(file)))
+        auto_property_col, auto_mailing_col = app.auto_map_columns(pd.DataFrame(columns=skip_traced_columns))
+        check_columns_exist('the skip traced files', skip_traced_columns, [args.skip_property_col, args.skip_mailing_col])
+        combined_property_col = args.skip_property_col or auto_property_col
+        combined_mailing_col = args.skip_mailing_col or auto_mailing_col
+    if args.skip_traced and not args.dask:
+        # Dask reads the skip traced files itself, partition by partition
+        key_columns = [col for col in [combined_property_col, combined_mailing_col] if col in skip_traced_columns]
+        combined_df = app.load_and_combine_files(args.skip_traced, columns=key_columns if args.project else None)
+        with app.track_stage('combine_dedupe', len(combined_df)):
+            combined_df = combined_df.drop_duplicates(subset=[col for col in [combined_property_col, combined_mailing_col] if col in combined_df.columns])
+        combined_df = combined_df.rename(columns={
+            combined_property_col: 'property_address',
+            combined_mailing_col: 'mailing_address'
+        })
+
+    # Map the target columns from the headers only; the files themselves are read once below
+    targets = []
+    for target in args.target:
+        target_header = pd.read_csv(target, nrows=0)
+        auto_property_col, auto_mailing_col = app.auto_map_columns(target_header)
+        needs_property_col = args.target_property_col or auto_property_col
+        needs_mailing_col = args.target_mailing_col or auto_mailing_col
+        check_columns_exist(target, target_header.columns, [args.target_property_col, args.target_mailing_col])
+
+        mapping_error = app.check_column_mapping(args.scrub_on, combined_property_col, combined_mailing_col, needs_property_col, needs_mailing_col)
+        if mapping_error:
+            raise ValueError(mapping_error if len(args.target) == 1 else f"{target}: {mapping_error}")
+        targets.append((target, target, needs_property_col, needs_mailing_col))
+    target = args.target[0]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.dask:
+        return app.scrub_data_dask(
+            [target], args.skip_traced, args.scrub_on, needs_property_col, needs_mailing_col,
+            combined_property_col, combined_mailing_col, args.output_dir, file_format=args.format,
+            scheduler=args.dask_scheduler, partitions=args.dask_partitions
+        )
+    if args.stream or len(targets) > 1:
+        allskipped_df, fingerprints = None, None
+        use_store = args.saved_index and app.suppression_store != 'files'
+        if args.saved_index and not use_store:
+            with app.track_stage('index_load'):
+                if args.fuzzy_threshold is None:
+                    fingerprints = app.load_suppression_fingerprints(args.scrub_on)
+                else:
+                    allskipped_df = app.load_suppression_index(args.scrub_on)
+        elif not args.saved_index:
+            allskipped_df = app.normalize_key_columns(combined_df, args.scrub_on)
+        if len(targets) > 1:
+            _, summary = app.scrub_batch(
+                targets, allskipped_df, args.scrub_on, output_dir=args.output_dir, fingerprints=fingerprints,
+                use_store=use_store, file_format=args.format, fuzzy_threshold=args.fuzzy_threshold
+            )
+            return sum(row['hits'] for row in summary), sum(row['rows'] for row in summary)
+        hits_path, filtered_path, hit_count, row_count = app.scrub_file_in_chunks(
+            target, allskipped_df, args.scrub_on, needs_property_col, needs_mailing_col,
+            chunk_rows=args.chunk_rows, output_dir=args.output_dir, fingerprints=fingerprints, use_store=use_store,
+            file_format=args.format
+        )
+        app.finish_result_files(hits_path, filtered_path, args.format)
+        return hit_count, row_count
+
+    with app.track_stage('csv_load') as record:
+        needs_df = pd.read_csv(target)
+        record['rows'] = len(needs_df)
+    needs_df = needs_df.rename(columns={
+        needs_property_col: 'property_address',
+        needs_mailing_col: 'mailing_address'
+    })
+    if args.saved_index and app.suppression_store != 'files':
+        hits_df, needs_df_filtered = app.scrub_against_store(needs_df, args.scrub_on)
+    elif args.saved_index:
+        hits_df, needs_df_filtered = app.scrub_against_index(needs_df, args.scrub_on, fuzzy_threshold=args.fuzzy_threshold)
+    else:
+        load_rows = None
+        if args.project:
+            def load_rows(rows):
+                return app.load_combined_rows(args.skip_traced, rows).rename(columns={
+                    combined_property_col: 'property_address',
+                    combined_mailing_col: 'mailing_address'
+                })
+        hits_df, needs_df_filtered = app.scrub_data(needs_df, combined_df, args.scrub_on, load_rows=load_rows,
+                                                    fuzzy_threshold=args.fuzzy_threshold)
+    app.export_results(hits_df, needs_df_filtered, args.format, output_dir=args.output_dir)
+    return len(hits_df), len(needs_df)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app.start_stage_metrics()
+    try:
+        with app.profile_run(args.profile, enabled=args.profile is not None):
+            hit_count, row_count = run_scrub(args)
+    except (OSError, ValueError, ConnectionError, app.sqlite3.Error, app.psycopg2.Error) as e:
+        print(f"Error scrubbing {', '.join(args.target)}: {e}", file=sys.stderr)
+        return 1
+
+    if args.update_hit_counter:
+        with app.track_stage('db_update'):
+            app.record_hits(hit_count)
+            if not app.flush_hit_counter():
+                print("Warning: the hit counter could not be updated", file=sys.stderr)
+
+    print(f"Scrubbed {row_count} rows of {', '.join(args.target)}: {hit_count} hits, {row_count - hit_count} remaining. "
+          f"Results written to {args.output_dir}")
+    if args.metrics:
+        with open(args.metrics, 'w') as metrics_file:
+            json.dump(app.stage_metrics_report(), metrics_file, indent=2)
+    if args.rule_hits:
+        with open(args.rule_hits, 'w') as rule_hits_file:
+            json.dump(app.preprocess_rule_report(), rule_hits_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# The persistent normalization cache stays off, and saved jobs, the suppression index and the
+# SQLite store go to a temporary directory instead of the working directory
+os.environ['NORMALIZATION_CACHE_PATH'] = ''
+test_data_dir = tempfile.mkdtemp(prefix='scrub_tests_')
+os.environ['SCRUB_JOBS_DIR'] = os.path.join(test_data_dir, 'scrub_jobs')
+os.environ['SUPPRESSION_INDEX_DIR'] = os.path.join(test_data_dir, 'suppression_index')
+os.environ['SUPPRESSION_SQLITE_PATH'] = os.path.join(test_data_dir, 'suppression.sqlite3')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(test_data_dir, ignore_errors=True)
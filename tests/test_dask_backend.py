@@ -0,0 +1,42 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+import app
+import benchmark
+import scrub_cli
+
+distributed = pytest.importorskip('distributed')
+pytest.importorskip('dask.dataframe')
+
+
+# Function to read result files as sorted text rows, so row order and partitioning do not matter
+def read_sorted(paths):
+    df = pd.concat([pd.read_csv(path, dtype=str, keep_default_na=False) for path in paths], ignore_index=True)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('scrub_on', ['Both', 'Property Address'])
+def test_dask_scrub_matches_in_memory_scrub(tmp_path, scrub_on):
+    needs_df, allskipped_df = benchmark.generate_scrub_frames(app, 600, seed=7)
+    target, skip_traced = tmp_path / 'target.csv', tmp_path / 'skip.csv'
+    needs_df.to_csv(target, index=False)
+    allskipped_df.to_csv(skip_traced, index=False)
+
+    assert scrub_cli.main(['--skip-traced', str(skip_traced), '--target', str(target), '--scrub-on', scrub_on,
+                           '--output-dir', str(tmp_path / 'memory')]) == 0
+    with distributed.LocalCluster(processes=False, n_workers=2, threads_per_worker=1, dashboard_address=None) as cluster:
+        hits, rows = app.scrub_data_dask(
+            [str(target)], [str(skip_traced)], scrub_on, 'property_address', 'mailing_address',
+            'property_address', 'mailing_address', str(tmp_path / 'dask'), scheduler=cluster, partitions=4
+        )
+
+    memory_hits = read_sorted([tmp_path / 'memory' / 'Hits.csv'])
+    assert rows == len(needs_df)
+    assert hits == len(memory_hits) > 0
+    assert len(glob.glob(os.path.join(tmp_path, 'dask', 'Hits', 'part-*.csv'))) == 4
+    pd.testing.assert_frame_equal(read_sorted(glob.glob(os.path.join(tmp_path, 'dask', 'Hits', '*.csv'))), memory_hits)
+    pd.testing.assert_frame_equal(read_sorted(glob.glob(os.path.join(tmp_path, 'dask', 'Filtered_file', '*.csv'))),
+                                  read_sorted([tmp_path / 'memory' / 'Filtered_file.csv']))
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+import benchmark
+
+# Addresses the column kernels hand back to the scalar functions, or that exercise single rules
+FALLBACK_ADDRESSES = [
+    '123 Café Street', '77 Señor Ave apt 4', '12 Straße Rd', '9 North Ünter Ln',
+    '1234567890123456789 Main St', '12345678901234567890123 Oak Ave', '9999999999999999999',
+    '100 Twenty First St', '45 one hundred and first ave', '8 Fifty Ninth Ext unit 60', '3 north twenty second rd',
+    '12 Main St #-5', '40 Oak Ave #-12b', '7 Pine Rd 4-unit', '19 Elm St 12-unit',
+    '1234 - 56 W state rte', '88 - 7 State Route', '5 - 300 north state rt',
+    '12-A Maple Ave', '300-B Cedar Ln', '12 Main St 14', '14 Hill Rd #3', '# 5 Lake Dr',
+    '', '   ', 'P.O. Box 12', 'Suite 400 100 Main St', '22 park bldg. 3', 'N', 'Apt',
+]
+
+
+# Function to normalize a series one address at a time, the way scrub_data used to
+def scalar_normalize(series):
+    return series.fillna('').astype(str).apply(app.preprocess_address).apply(app.standardize_and_normalize_address).str.lower()
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_normalize_address_series_matches_scalar_functions(seed):
+    needs_df, allskipped_df = benchmark.generate_scrub_frames(app, 2000, seed)
+    rng = np.random.default_rng(seed)
+    fallbacks = pd.Series(FALLBACK_ADDRESSES)
+    corpus = pd.concat([
+        needs_df['property_address'], allskipped_df['mailing_address'],
+        fallbacks, fallbacks.str.upper(), fallbacks.str.title(),
+        pd.Series([None, np.nan]),
+    ], ignore_index=True)
+    corpus = corpus.iloc[rng.permutation(len(corpus))]
+
+    pd.testing.assert_series_equal(app.normalize_address_series(corpus), scalar_normalize(corpus), check_names=False)
+
+
+def test_normalize_address_series_keeps_index_and_name():
+    series = pd.Series(['12 Main Street', '12 main st', None], index=[5, 3, 9], name='property_address')
+    normalized = app.normalize_address_series(series)
+    assert list(normalized.index) == [5, 3, 9]
+    assert normalized.name == 'property_address'
+    assert normalized[5] == normalized[3]
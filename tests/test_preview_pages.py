@@ -0,0 +1,22 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import app
+import benchmark
+
+
+@pytest.mark.parametrize('file_format', ['csv', 'csv.gz', 'parquet'])
+def test_page_file_pages_match_the_result_file(tmp_path, monkeypatch, file_format):
+    monkeypatch.setattr(app, 'preview_row_group_rows', 70)
+    needs_df, _ = benchmark.generate_scrub_frames(app, 500, seed=5)
+    needs_df = needs_df.astype(str)
+    result_path, page_path = str(tmp_path / f'Hits.{file_format}'), str(tmp_path / 'page_hits.parquet')
+    app.write_result_file(needs_df, result_path, file_format)
+
+    app.write_page_file(result_path, page_path)
+    assert pq.ParquetFile(page_path).metadata.num_rows == len(needs_df)
+    expected = app.title_case_address_columns(needs_df.copy())
+    for start in [0, 60, 130, 480, 500]:
+        page = app.read_parquet_page(page_path, start, 100)
+        pd.testing.assert_frame_equal(page.astype(str), expected.iloc[start:start + 100].reset_index(drop=True))
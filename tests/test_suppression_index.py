@@ -0,0 +1,24 @@
+import concurrent.futures
+
+import app
+import benchmark
+
+
+def test_concurrent_ingests_keep_every_part(tmp_path):
+    index_dir = str(tmp_path / 'index')
+    paths = []
+    for seed in range(6):
+        _, allskipped_df = benchmark.generate_scrub_frames(app, 400, seed=seed)
+        paths.append(str(tmp_path / f'skip_{seed}.csv'))
+        allskipped_df.to_csv(paths[-1], index=False)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        added = list(executor.map(
+            lambda path: app.ingest_suppression_file(path, 'property_address', 'mailing_address', index_dir=index_dir),
+            paths
+        ))
+
+    assert added == [True] * len(paths)
+    manifest = app.load_suppression_manifest(index_dir)
+    assert sorted(manifest['files']) == sorted(app.file_content_hash(path) for path in paths)
+    assert not app.ingest_suppression_file(paths[0], 'property_address', 'mailing_address', index_dir=index_dir)
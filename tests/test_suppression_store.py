@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import app
+import benchmark
+
+
+# Function to list the target rows of a result; the in-memory hits also carry the skip traced columns
+def hit_owners(df):
+    return sorted(df['owner_id'].drop_duplicates().tolist())
+
+
+@pytest.fixture
+def sqlite_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'suppression_store', 'sqlite')
+    monkeypatch.setattr(app, 'suppression_sqlite_path', str(tmp_path / 'suppression.sqlite3'))
+    return tmp_path
+
+
+@pytest.mark.parametrize('scrub_on', ['Both', 'Property Address', 'Mailing Address'])
+def test_store_scrub_matches_in_memory_scrub(sqlite_store, monkeypatch, scrub_on):
+    needs_df, allskipped_df = benchmark.generate_scrub_frames(app, 600, seed=11)
+    skip_traced = sqlite_store / 'skip.csv'
+    allskipped_df.to_csv(skip_traced, index=False)
+
+    assert app.store_suppression_file(str(skip_traced), 'property_address', 'mailing_address')
+    assert not app.store_suppression_file(str(skip_traced), 'property_address', 'mailing_address')
+    assert app.suppression_store_summary()[0] == 1
+
+    memory_hits, memory_filtered = app.scrub_data(needs_df.copy(), allskipped_df.copy(), scrub_on)
+    store_hits, store_filtered = app.scrub_against_store(needs_df.copy(), scrub_on)
+    assert len(store_hits) + len(store_filtered) == len(needs_df)
+    assert hit_owners(store_hits) == hit_owners(memory_hits)
+    assert len(store_hits) > 0
+    pd.testing.assert_frame_equal(store_filtered.reset_index(drop=True), memory_filtered.reset_index(drop=True))
+
+    # A rule change re-normalizes the stored keys on the next connection; the hits stay the same
+    monkeypatch.setattr(app, 'rules_version', app.rules_version + '-changed')
+    rescrub_hits, _ = app.scrub_against_store(needs_df.copy(), scrub_on)
+    assert hit_owners(rescrub_hits) == hit_owners(memory_hits)